@@ -8,10 +8,13 @@
 ## written in python3
 
 from numpy import *
-import os, re, glob, shutil
+import os, re, glob, shutil, random, hashlib, json, mmap, signal, zipfile
+import numpy as np
 import pandas as pd
 from argparse import ArgumentParser
 import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from run_manifest import RunManifest
 
 # set colors for warnings so they are seen
 CRED = '\033[91m' + '\nWarning:'
@@ -19,220 +22,660 @@ CYEL = '\033[93m'
 CEND = '\033[0m'
 
 #Before running you need to load the modules
-#module load seqkit/1.0
-#module load BBMap/38.90
 #module load snippy/4.3.8
 
-pd.set_option("max_columns", 50)
-pd.set_option("max_rows", 50)
+pd.set_option("display.max_columns", 50)
+pd.set_option("display.max_rows", 50)
 
+# Columns read from the pangolin report and the mapping file, with their dtypes
+PANGO_DTYPES = {"taxon": "string", "lineage": "category", "probability": "float64", "pangoLEARN_version": "category", "status": "category", "note": "string"}
+MAPPING_DTYPES = {"GISAID_ID": "string", "SRR_ID": "string"}
 
-def parse_cmdline():
-	"""Parse command-line arguments for script."""
+LINEAGE_STATS_FILE = 'Pango_Random_Genomes_Lineage_Stats.tsv'
+UNMATCHED_FILE = 'Unmatched_IDs.tsv'
+HEADER_RULES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "header_rules.tsv")
+# Versions recorded in the run manifest, the tools are asked for their version at startup
+TOOL_VERSIONS = {"snippy": ["snippy", "--version"], "snippy-core": ["snippy-core", "--version"]}
+PACKAGES = ["numpy", "pandas", "pyarrow"]
+
+
+def parse_cmdline(argv=None):
+	"""Parse command-line arguments for script, from sys.argv unless argv is given."""
 	parser = ArgumentParser(prog="Generate_Random_Fasta.py", description="""This script will get 30 random genomes for wach VOC/VOI, run snippy on each sequence and generate a csv file with the information merged at the end. The following VOCs/VOIs are used: B.1.1.7, B.1.351, B.1.427, B.1.429, P.1, B.1.526, B.1.525, B.1.526.1,P.2.
 	This script expectsb a pangolin report like XXXXX.pangolin_report.csv and SrrGisMapping.tsv are in the same directory as this script.""")
 	parser.add_argument("-p", "--pandolin-report", dest="pangolin_input", action="store", default=False, required=True, help="Pass the pangolin report file.")
 	parser.add_argument("-f", "--fasta", dest="full_fasta", action="store", default=False, required=True, help="Pass a fasta file with all sequences of variants to be split.")
 	parser.add_argument("-v", "--variants", dest="variants", action="store", default=False, required=False, help="A file with one variant on each line, will be converted to a list.")
-	parser.add_argument("-r", "--random-only", dest="random_only", action="store_true", default=False, required=False, help="This flag will just rerun picking random sequences. This bypasses the creation of the .txt or .fasta files.")
-	parser.add_argument("-n", "--seq-num", dest="seq_num", action="store", default=30, required=False, help="The number of random sequences to pull for each VOC/VOIs.")
+	parser.add_argument("-r", "--random-only", dest="random_only", action="store_true", default=False, required=False, help="This flag will just rerun picking random sequences. Random sequences are now picked straight from the full fasta so this is the same as the default.")
+	parser.add_argument("-n", "--seq-num", dest="seq_num", action="store", type=int, default=30, required=False, help="The number of random sequences to pull for each VOC/VOIs.")
+	parser.add_argument("-s", "--seed", dest="seed", action="store", type=int, default=None, required=False, help="Seed for picking random sequences, use the same seed to pick the same sequences again.")
 	parser.add_argument("-a", "--all", dest="all_samples", action="store_true", default=False, required=False, help="This flag just runs everything rather than picking random samples.")
 	parser.add_argument("-ref", "--ref-path", dest="ref_path", action="store", default=False, required=True, help="Full path for where reference sequences are found.")
 	parser.add_argument("-m", "--srr-to-gisaid-map", dest="mapping_file", action="store", default=False, required=True, help="Full path for where a mapping file can be found. Should be tab separated with at least the following columns GISAID_ID and SRR_ID.")
-	args = parser.parse_args()
+	parser.add_argument("--header-rules", dest="header_rules", action="store", default=HEADER_RULES, required=False, help="Tab separated file with the rules used to match the pangolin taxon column to the fasta headers, see header_rules.tsv next to this script.")
+	parser.add_argument("-x", "--fasta-index", dest="fasta_index", action="store_true", default=False, required=False, help="Keep an index of where each GISAID ID is in the full fasta (<fasta>.gidx.npz) and pull sequences out with it instead of reading the whole fasta. The index is made on the first run and remade when the fasta changes.")
+	parser.add_argument("--index-dir", dest="index_dir", action="store", default=None, required=False, help="Keep the --fasta-index index in this directory instead of next to the fasta, e.g. when the fasta is in a shared read-only location. Without it the working directory is used when the fasta directory can not be written to.")
+	parser.add_argument("-i", "--indexed-samples", dest="indexed_samples", action="store_true", default=False, required=False, help="Keep the samples of each VOC/VOI in one indexed fasta instead of one fasta file per sample.")
+	parser.add_argument("--cache-dir", dest="cache_dir", action="store", default="table_cache", required=False, help="Directory where parsed copies of the pangolin report and mapping file are kept as parquet files for faster reruns.")
+	parser.add_argument("--no-cache", dest="cache_dir", action="store_const", const=None, required=False, help="Always parse the pangolin report and mapping file, do not read or write the parquet cache.")
+	parser.add_argument("-l", "--live-stats", dest="live_stats", action="store_true", default=False, required=False, help="Write the per VOC/VOI stats to Pango_Random_Genomes_Lineage_Stats.tsv as each VOC/VOI finishes snippy instead of only at the end.")
+	parser.add_argument("-t", "--threads", dest="threads", action="store", type=int, default=16, required=False, help="The total number of cpus snippy jobs can use at the same time.")
+	parser.add_argument("-c", "--cpus-per-job", dest="cpus_per_job", action="store", type=int, default=4, required=False, help="The number of cpus given to each snippy job, --threads/--cpus-per-job jobs are run at once.")
+	parser.add_argument("--manifest", dest="manifest", action="store", default="Generate_fasta_manifest.json", required=False, help="Json file where the tool versions and the time, cpu, memory and bytes read/written of each stage are written.")
+	parser.add_argument("--profile", dest="profile", action="store", default=None, required=False, help="Also write cProfile stats of the run to this file, read them with python -m pstats.")
+	args = parser.parse_args(argv)
 	return args
 
-def get_file(variants, ref_path, pangolin_input, all_samples, seq_num, random_only, full_fasta):
-	"""For each variant do the following."""
+def get_file(args, manifest, df_SRR):
+	"""For each variant do the following. args are the parsed command line options, see parse_cmdline, and df_SRR is the mapping file."""
 	#VOC_VOI_list = ["B.1.1.7", "B.1.351", "B.1.427", "B.1.429", "P.1", "B.1.526", "B.1.525", "B.1.526.1" ,"P.2"]# list of VOIs/VOCs
 	#VOC_VOI_list = ["B.1.617.1", "B.1.617.2", "B.1.617.3"]# list of VOIs/VOCs
-	with open(variants) as f:
+	with open(args.variants) as f:
 		VOC_VOI_list = [line.rstrip() for line in f]
 	df = pd.DataFrame(columns = ["taxon", "lineage", "probability", "pangoLEARN_version", "status", "note", "ID", "LENGTH", "ALIGNED", "UNALIGNED", "VARIANT", "HET", "MASKED", "LOWCOV"]) # creating empty dataframe for later
-	Pango_Output = pd.read_csv(pangolin_input, sep=',', header=0)  # open file
-	Pango_Output_VOCI = Pango_Output[Pango_Output['lineage'].isin(VOC_VOI_list)] # reduce dataframe to only VOC/VOI for faster compute. This removes ~20K rows
-	if random_only == False and all_samples == False:
-		count = 0 # to make sure we create our dataframe right
-		for variant in VOC_VOI_list: # Loop through VOCs/VOIs in list
-			Variant_df = Pango_Output_VOCI[Pango_Output_VOCI['lineage']==variant] # get dataframe with only one VOC/VOI
-			num_seq = shape(Variant_df)[0] # get number of total sequences for VOC/VOI
-			variant_fasta = variant + ".fasta"
-			variant_headers = generate_header_file(variant, Variant_df) # get headers for filtering
-			print(CYEL + "There are {} sequences for the variant {}. The sequence IDs were printed to {}.\n".format(num_seq, variant, variant_headers) + CEND)
-			seqkit_version = generate_fasta(variant_headers, variant_fasta, full_fasta) # generate fasta by filtering using headers file
-			print(CYEL + "Finished running Seqkit on variants.\n" + CEND)
-			variant_random_fasta, bbmap_version = random_sampling_variant_fasta(seq_num, variant, variant_fasta)
-			generate_input_file(variant, variant_random_fasta) # This generats the .tab input file for snippy to run on each sequence.
-			snippy_version = run_snippy(ref_path, variant, variant_fasta) # Run snippy on each sample
-			if count == 0:
-				df_merge = combine_output(variant, Pango_Output_VOCI, df)
-				count = count + 1
-			else:
-				df_merge = combine_output(variant, Pango_Output_VOCI, df_merge)
-		df_merge.to_csv('Pango_Random_Genomes.csv', sep='\t', index=False)
-		print(CYEL + "This pipeline was run with {},{} and {}.\n".format(seqkit_version, bbmap_version, snippy_version) + CEND)
-	if random_only == True:
-		count = 0
-		for variant in VOC_VOI_list:
-			variant_fasta = variant + ".fasta"
-			variant_random_fasta, bbmap_version = random_sampling_variant_fasta(seq_num, variant, variant_fasta)
-			generate_input_file(variant, variant_random_fasta)
-			snippy_version = run_snippy(ref_path, variant, variant_fasta)
-			if count == 0:
-				df_merge = combine_output(variant, Pango_Output_VOCI, df)
-				count = count + 1
+	with manifest.stage("load report") as stage:
+		Pango_Output = load_table(args.pangolin_input, ',', PANGO_DTYPES, args.cache_dir)  # open file
+		Pango_Output_VOCI = Pango_Output[Pango_Output['lineage'].isin(VOC_VOI_list)].copy() # reduce dataframe to only VOC/VOI for faster compute. This removes ~20K rows
+		Pango_Output_VOCI['lineage'] = Pango_Output_VOCI['lineage'].cat.set_categories(VOC_VOI_list) # only the VOCs/VOIs, in the order of the list
+		Pango_Output_VOCI['ID'] = Pango_Output_VOCI['taxon'].str.split("|").str[1] # GISAID ID, computed once for all VOCs/VOIs
+		stage["records"] = len(Pango_Output)
+	lineage_counts = Pango_Output_VOCI['lineage'].value_counts()
+	for variant in VOC_VOI_list:
+		clean_up(variant, keep_snippy=args.all_samples) # remove old files before new ones are written, finished snippy runs are kept for --all
+		num_seq = lineage_counts[variant] # get number of total sequences for VOC/VOI
+		print(CYEL + "There are {} sequences for the variant {}.\n".format(num_seq, variant) + CEND)
+	header_rules = load_header_rules(args.header_rules)
+	taxon_keys = normalize_taxa(Pango_Output_VOCI['taxon'], header_rules) # the same rules are used on the fasta headers
+	taxon_lineage = dict(zip(taxon_keys, Pango_Output_VOCI['lineage'])) # hash of header -> lineage used to split the fasta
+	if args.fasta_index == True: # pull the sequences out of the full fasta by their offsets instead of reading all of it
+		with manifest.stage("subset fasta") as stage:
+			index = load_fasta_index(args.full_fasta, args.index_dir)
+			seq_counts, matched = subset_indexed_fasta(args.full_fasta, index, Pango_Output_VOCI, VOC_VOI_list, args.all_samples, args.seq_num, args.seed)
+			stage["records"] = int(np.sum(list(seq_counts.values())))
+		found = Pango_Output_VOCI['ID'].isin(matched)
+		print(CYEL + "Finished pulling sequences for {} variants from {} with its index.\n".format(len(VOC_VOI_list), args.full_fasta) + CEND)
+	elif args.all_samples == True:
+		with manifest.stage("split fasta") as stage:
+			seq_counts, matched = demultiplex_fasta(args.full_fasta, taxon_lineage, VOC_VOI_list, header_rules) # one pass over the full fasta writes every <variant>.fasta
+			stage["records"] = int(np.sum(list(seq_counts.values())))
+		found = taxon_keys.isin(matched)
+		print(CYEL + "Finished splitting {} into {} variant fasta files.\n".format(args.full_fasta, len(VOC_VOI_list)) + CEND)
+	else:
+		with manifest.stage("sample") as stage:
+			seq_counts, matched = sample_fasta(args.full_fasta, taxon_lineage, VOC_VOI_list, args.seq_num, args.seed, header_rules) # one pass over the full fasta writes every <variant>_<seq_num>RandomGenomes.fasta
+			stage["records"] = int(np.sum(list(seq_counts.values())))
+		found = taxon_keys.isin(matched)
+		print(CYEL + "Finished picking {} random sequences for {} variants from {} with seed {}.\n".format(args.seq_num, len(VOC_VOI_list), args.full_fasta, args.seed) + CEND)
+	report_unmatched(Pango_Output_VOCI, found)
+	with manifest.stage("split samples") as stage:
+		for variant in VOC_VOI_list: # Loop through VOCs/VOIs in list and make the snippy input files
+			if args.all_samples == True:
+				variant_fasta = variant + ".fasta"
 			else:
-				df_merge = combine_output(variant, Pango_Output_VOCI, df_merge)
+				variant_fasta = random_fasta_name(variant, args.seq_num)
+			print(CYEL + "Wrote {} sequences for the variant {} to {}.\n".format(seq_counts[variant], variant, variant_fasta) + CEND)
+			generate_input_file(variant, variant_fasta, args.indexed_samples) # This generats the .tab input file for snippy to run on each sequence.
+		stage["records"] = int(np.sum(list(seq_counts.values())))
+	lineage_groups = dict(list(Pango_Output_VOCI.groupby('lineage', observed=True))) # split the report by VOC/VOI once
+	frames = {}
+	def variant_done(variant):
+		frames[variant] = combine_output(variant, lineage_groups.get(variant, Pango_Output_VOCI.iloc[:0]))
+		if args.live_stats == True: # update the per VOC/VOI stats as each one finishes rather than only at the end
+			finished = pd.concat([frames[done] for done in VOC_VOI_list if done in frames], ignore_index=True) # in the order df_merge will have
+			lineage_stats(ID_check(df_SRR, finished, verbose=False)).to_csv(LINEAGE_STATS_FILE, sep='\t', index=False) # the same genomes cal_stats uses at the end
+			print(CYEL + "Added {} to {}.\n".format(variant, LINEAGE_STATS_FILE) + CEND)
+	with manifest.stage("snippy") as stage:
+		stage["records"] = run_snippy(args.ref_path, VOC_VOI_list, args.threads, args.cpus_per_job, variant_done) # Run snippy on each sample of every VOC/VOI
+	with manifest.stage("merge") as stage:
+		frames = [frames[variant] for variant in VOC_VOI_list if variant in frames]
+		df_merge = pd.concat(frames, ignore_index=True) if len(frames) > 0 else df # concat once at the end rather than growing the dataframe each loop
 		df_merge.to_csv('Pango_Random_Genomes.csv', sep='\t', index=False)
-		#print(CYEL + "This pipeline was run with {} and {}.\n".format(snippy_version, bbmap_version) + CEND)
-	if all_samples == True:
-		count = 0
+		stage["records"] = len(df_merge)
+	print(CYEL + "This pipeline was run with {}.\n".format(manifest.manifest["versions"].get("snippy")) + CEND)
+	return df_merge
+
+def load_header_rules(rules_file):
+	"""Reads the ordered header rules (rule, regex pattern, replacement) from a tab separated file. Lines starting with # are skipped.
+	A missing replacement is taken as empty."""
+	rules = []
+	with open(rules_file) as f:
+		lines = [line.rstrip("\r\n") for line in f if line.strip() != "" and not line.startswith("#")]
+	for line in lines[1:]: # first line is the header
+		fields = line.split("\t", 2)
+		replacement = fields[2] if len(fields) > 2 else "" # an empty replacement is easily lost to an editor stripping trailing tabs
+		rules.append((fields[0], re.compile(fields[1]), replacement))
+	return rules
+
+def normalize_taxa(taxon, rules):
+	"""Applies the header rules to the whole taxon column of the pangolin report at once."""
+	for rule, pattern, replacement in rules:
+		taxon = taxon.str.replace(pattern, replacement, regex=True)
+	return taxon
+
+def normalize_header(header, rules):
+	"""Applies the header rules to one fasta header so it can be matched to the normalized taxon column."""
+	for rule, pattern, replacement in rules:
+		header = pattern.sub(replacement, header)
+	return header
+
+def report_unmatched(Pango_Output_VOCI, found):
+	"""Writes the sequences of the pangolin report that were not found in the fasta to Unmatched_IDs.tsv and prints how many there are for each variant."""
+	unmatched = Pango_Output_VOCI.loc[~found, ['ID', 'taxon', 'lineage']]
+	unmatched.to_csv(UNMATCHED_FILE, sep='\t', index=False)
+	if len(unmatched) > 0:
+		counts = unmatched['lineage'].value_counts()
+		print(CRED + " {} sequences in the pangolin report were not found in the fasta, they are listed in {}:\n{}".format(len(unmatched), UNMATCHED_FILE, counts[counts > 0].to_string()) + CEND)
+
+def read_fasta(fasta):
+	"""Streams a fasta file one record at a time, yielding the header (without '>') and the sequence."""
+	header = None
+	seq = []
+	with open(fasta, "r") as f:
+		for line in f:
+			line = line.rstrip("\r\n")
+			if line.startswith(">"):
+				if header is not None:
+					yield header, "".join(seq)
+				header = line[1:]
+				seq = []
+			elif header is not None:
+				seq.append(line)
+	if header is not None:
+		yield header, "".join(seq)
+
+def demultiplex_fasta(full_fasta, taxon_lineage, VOC_VOI_list, header_rules):
+	"""Reads the full fasta once and writes each record to <variant>.fasta based on its lineage in the pangolin report.
+	This replaces running seqkit grep over the full fasta once per variant.
+	Returns the number of sequences written for each variant and the normalized headers that were found."""
+	seq_counts = dict.fromkeys(VOC_VOI_list, 0)
+	matched = set()
+	handles = {variant: open(variant + ".fasta", "w", newline='\n') for variant in VOC_VOI_list}
+	try:
+		for header, seq in read_fasta(full_fasta):
+			key = normalize_header(header, header_rules)
+			variant = taxon_lineage.get(key) # seqkit grep -n matched on the full header so we do the same after normalizing both
+			if variant in handles:
+				matched.add(key)
+				handles[variant].write(">" + header + "\n" + seq + "\n")
+				seq_counts[variant] = seq_counts[variant] + 1
+	finally:
+		for handle in handles.values():
+			handle.close()
+	return seq_counts, matched
+
+def fasta_index_name(full_fasta, index_dir=None):
+	"""Returns the name of the index of the full fasta, kept next to it unless index_dir is given."""
+	if index_dir is None:
+		return full_fasta + ".gidx.npz"
+	return os.path.join(index_dir, os.path.basename(full_fasta) + ".gidx.npz")
+
+def build_fasta_index(full_fasta):
+	"""Reads the full fasta once and records the byte offset and length of every record against its GISAID ID (the second | field of the header).
+	The IDs are sorted so they can be looked up with a binary search. The size and mtime of the fasta are kept to tell when it has changed."""
+	ids = []
+	offsets = []
+	position = 0
+	with open(full_fasta, "rb") as f:
+		for line in f:
+			if line.startswith(b">"):
+				fields = line[1:].split(b"|")
+				ids.append(fields[1].strip() if len(fields) > 1 else b"") # records without an ID are kept so the lengths stay right
+				offsets.append(position)
+			position = position + len(line)
+	offsets = np.array(offsets + [position], dtype=np.uint64)
+	lengths = offsets[1:] - offsets[:-1]
+	ids = np.array(ids, dtype=bytes)
+	order = np.argsort(ids, kind="stable")
+	stat = os.stat(full_fasta)
+	print(CYEL + "Indexed {} sequences in {}.\n".format(len(ids), full_fasta) + CEND)
+	return {"ids": ids[order], "offsets": offsets[:-1][order], "lengths": lengths[order], "source": np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)}
+
+def save_fasta_index(index, index_file):
+	"""Writes the index to a temporary file and moves it into place, so a job killed while writing never leaves a broken index behind."""
+	tmp_file = index_file + ".tmp"
+	try:
+		with open(tmp_file, "wb") as f:
+			np.savez(f, **index)
+		os.replace(tmp_file, index_file)
+	finally:
+		if os.path.exists(tmp_file):
+			os.remove(tmp_file)
+
+def read_fasta_index(full_fasta, index_file):
+	"""Returns the index saved in index_file, or None if it is missing, can not be read or was made from a different version of the fasta."""
+	if not os.path.exists(index_file):
+		return None
+	try:
+		with np.load(index_file) as saved:
+			index = dict(saved)
+	except (OSError, ValueError, EOFError, zipfile.BadZipFile) as e:
+		print(CRED + " Could not read the fasta index {} ({}), it will be made again.\n".format(index_file, e) + CEND)
+		return None
+	stat = os.stat(full_fasta)
+	if "source" not in index or index["source"].tolist() != [stat.st_size, stat.st_mtime_ns]:
+		return None
+	return index
+
+def load_fasta_index(full_fasta, index_dir=None):
+	"""Loads the index of the full fasta, making it first if it is missing, broken or the fasta has changed since it was made.
+	The index is kept in index_dir if given. Otherwise it is kept next to the fasta, or in the working directory when the fasta is somewhere we can not write."""
+	if index_dir is not None:
+		os.makedirs(index_dir, exist_ok=True)
+		index_files = [fasta_index_name(full_fasta, index_dir)]
+	else:
+		index_files = list(dict.fromkeys([fasta_index_name(full_fasta), fasta_index_name(full_fasta, os.getcwd())]))
+	for index_file in index_files:
+		index = read_fasta_index(full_fasta, index_file)
+		if index is not None:
+			return index
+	index = build_fasta_index(full_fasta)
+	for index_file in index_files:
+		try:
+			save_fasta_index(index, index_file)
+			return index
+		except OSError as e:
+			if index_file == index_files[-1]:
+				raise
+			print(CRED + " Could not write the fasta index to {} ({}), keeping it in the working directory instead.\n".format(index_file, e) + CEND)
+
+def lookup_fasta_index(index, IDs):
+	"""Returns the positions in the index of the IDs that are in the fasta, in the order given."""
+	wanted = np.array(list(IDs), dtype=bytes)
+	if len(wanted) == 0 or len(index["ids"]) == 0:
+		return np.array([], dtype=np.int64)
+	positions = np.searchsorted(index["ids"], wanted)
+	positions[positions == len(index["ids"])] = 0
+	return positions[index["ids"][positions] == wanted]
+
+def write_indexed_records(fasta_map, index, positions, out_fasta):
+	"""Writes the records at the positions of the index to out_fasta, copying each one straight from the memory mapped fasta in file order."""
+	offsets = index["offsets"][positions]
+	lengths = index["lengths"][positions]
+	with open(out_fasta, "wb") as f:
+		for i in np.argsort(offsets, kind="stable"):
+			f.write(fasta_map[int(offsets[i]):int(offsets[i] + lengths[i])])
+
+def subset_indexed_fasta(full_fasta, index, Pango_Output_VOCI, VOC_VOI_list, all_samples, seq_num, seed):
+	"""Writes every sequence of each variant to <variant>.fasta with all_samples, otherwise seq_num random ones to <variant>_<seq_num>RandomGenomes.fasta,
+	using the index of the full fasta. Returns the number of sequences written for each variant and the IDs that were found."""
+	rng = random.Random(seed)
+	seq_counts = {}
+	matched = set()
+	lineage_ids = {variant: IDs for variant, IDs in Pango_Output_VOCI.groupby('lineage', observed=True)['ID']}
+	with open(full_fasta, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as fasta_map:
 		for variant in VOC_VOI_list:
-			clean_up(variant)
-			Variant_df = Pango_Output_VOCI[Pango_Output_VOCI['lineage']==variant] # get dataframe with only one VOC/VOI
-			num_seq = shape(Variant_df)[0] # get number of total sequences for VOC/VOI
-			variant_fasta = variant + ".fasta"
-			variant_headers = generate_header_file(variant, Variant_df) # get headers for filtering
-			print(CYEL + "There are {} sequences for the variant {}. The sequence IDs were printed to {}.\n".format(num_seq, variant, variant_headers) + CEND)
-			seqkit_version = generate_fasta(variant_headers, variant_fasta, full_fasta) # generate fasta by filtering using headers file
-			print(CYEL + "Finished running Seqkit on variants.\n" + CEND)
-			generate_input_file(variant, variant_fasta)
-			snippy_version = run_snippy(ref_path, variant, variant_fasta)
-			if count == 0:
-				df_merge = combine_output(variant, Pango_Output_VOCI, df)
-				count = count + 1
+			IDs = lineage_ids.get(variant, pd.Series([], dtype=str)).dropna().astype(str).str.encode("utf-8")
+			positions = np.unique(lookup_fasta_index(index, IDs)) # each record once even if its ID is in the report twice
+			matched.update(ID.decode("utf-8") for ID in index["ids"][positions])
+			if all_samples == True:
+				out_fasta = variant + ".fasta"
 			else:
-				df_merge = combine_output(variant, Pango_Output_VOCI, df_merge)
-		df_merge.to_csv('Pango_Random_Genomes.csv', sep='\t', index=False)
-		return df_merge
-
-def generate_header_file(variant, Variant_df):
-	"""Generates a txt file that contains sequence headers that will be used to filter sequences."""
-	variant_headers = variant + ".txt"
-	with open(variant_headers, "w", newline='\n') as file:
-		Variant_df.taxon.to_csv(file, index=False, header=False, line_terminator='\n')
-	# In GISAID, Northern_Ireland is missing its underscore so we have to adjust our file to reflect this.
-	with open(variant_headers, "r") as file:
-		filedata = file.read()
-		filedata = filedata.replace('Northern_Ireland', 'Northern Ireland')
-	with open(variant_headers, 'w', newline='\n') as file:
-		file.write(filedata)
-	return variant_headers
-
-def generate_fasta(variant_headers, variant_fasta, full_fasta):
-	"""Generates a fasta file by filtering with seqkit for headers we want in the variant_headers file."""
-	seqkit_version = "seqkit 1.0"
-	subprocess.call("seqkit grep -n -f " + str(variant_headers) + " " + full_fasta + " > " + str(variant_fasta), shell=True)
-	return seqkit_version
-
-def random_sampling_variant_fasta(seq_num, variant, variant_fasta):
-	"""Generates a fasta file with random sampling from the full fasta file."""
-	clean_up(variant)
-	variant_random_fasta = variant + "_"+ seq_num +"RandomGenomes.fasta"
-	bbmap_version = "BBMap/38.90"
-	subprocess.call("reformat.sh in=" + str(variant_fasta) + " out=" + str(variant_random_fasta) + " samplereadstarget="+ seq_num, shell=True)
-	return variant_random_fasta, bbmap_version
-
-def clean_up(variant):
-	'''Deletes old version of files and directory so it doesn't keep appending in the generate_input_file function.'''
-	try:
-		os.remove(variant + ".tab")
-	except OSError as e:
-		pass
+				out_fasta = random_fasta_name(variant, seq_num)
+				positions = np.array(sorted(rng.sample(sorted(positions.tolist()), seq_num if seq_num < len(positions) else len(positions))), dtype=np.int64)
+			write_indexed_records(fasta_map, index, positions, out_fasta)
+			seq_counts[variant] = len(positions)
+	return seq_counts, matched
+
+def random_fasta_name(variant, seq_num):
+	"""Returns the name of the fasta file with the random sequences picked for a variant."""
+	return variant + "_" + str(seq_num) + "RandomGenomes.fasta"
+
+def sample_fasta(full_fasta, taxon_lineage, VOC_VOI_list, seq_num, seed, header_rules):
+	"""Picks seq_num random sequences for each variant in one pass over the full fasta using reservoir sampling (Algorithm R)
+	and writes them to <variant>_<seq_num>RandomGenomes.fasta. The same seed and full fasta always give the same sequences.
+	Returns the number of sequences written for each variant and the normalized headers that were found."""
+	rng = random.Random(seed)
+	seen = dict.fromkeys(VOC_VOI_list, 0)
+	reservoirs = {variant: [] for variant in VOC_VOI_list}
+	matched = set()
+	for header, seq in read_fasta(full_fasta):
+		key = normalize_header(header, header_rules)
+		variant = taxon_lineage.get(key)
+		if variant not in reservoirs:
+			continue
+		matched.add(key)
+		seen[variant] = seen[variant] + 1
+		if len(reservoirs[variant]) < seq_num:
+			reservoirs[variant].append((header, seq))
+		else:
+			j = rng.randrange(seen[variant]) # keep this record with probability seq_num/seen
+			if j < seq_num:
+				reservoirs[variant][j] = (header, seq)
+	seq_counts = {}
+	for variant in VOC_VOI_list:
+		with open(random_fasta_name(variant, seq_num), "w", newline='\n') as f:
+			for header, seq in reservoirs[variant]:
+				f.write(">" + header + "\n" + seq + "\n")
+		seq_counts[variant] = len(reservoirs[variant])
+	return seq_counts, matched
+
+def clean_up(variant, keep_snippy=False):
+	'''Deletes old version of files and directory so it doesn't keep appending in the generate_input_file function.
+	With keep_snippy the variant directory is left in place so finished snippy runs are skipped on the next run.'''
 	try:
-		os.remove(variant + "_30RandomGenomes.fasta")
+		os.remove(os.path.join(variant, variant + ".tab"))
 	except OSError as e:
 		pass
+	for random_fasta in glob.glob(glob.escape(variant) + "_*RandomGenomes.fasta"):
+		try:
+			os.remove(random_fasta)
+		except OSError as e:
+			pass
 	try:
 		os.remove(variant + ".fasta")
 	except OSError as e:
 		pass
-	try:
-		os.remove(variant + ".txt")
-	except OSError as e:
-		pass
+	for samples_file in [samples_fasta_name(variant), samples_fasta_name(variant) + ".fai"]:
+		try:
+			os.remove(samples_file)
+		except OSError as e:
+			pass
+	if keep_snippy == True:
+		return
 	try:
 		shutil.rmtree(variant) # deletes directory and all its contents.
 	except OSError as e:
 		pass
 
-def generate_input_file(variant, file ):
-	'''Generates a input file as an input for snippy'''
-	os.mkdir(variant) # create directory for each variant
-	os.chdir(variant) # got into directory
-	subprocess.call("awk -F '|' '/^>/ {F=sprintf(\"%s.fasta\",$2); print > F;next;} {print >> F;}' < ../" + str(file), shell=True) # split fasta into individual files in new directory
-	split_files = glob.glob('*.fasta')  # grabbing all new fasta files to loop through
-	snippy_input_file = variant + ".tab"  # create snippy input file name
-	for split_file in split_files: # loop through split files
-		split_file_name = split_file.replace(".fasta","") # get GSAID ID name
-		full_file_path = os.path.normpath(os.getcwd() + os.sep + os.pardir) + "/" + variant + "/" + split_file
-		line = split_file_name + "\t" + full_file_path + "\n"
-		with open(snippy_input_file, "a") as f:
-			f.write(line)
-	os.chdir("../")
-
-def run_snippy(ref_path, variant, variant_fasta):
-	'''Runs Snippy on each VOC/VOI '''
-	os.chdir(variant)
-	snippy_version = "snippy 4.3.8"
-	snippy_input_file = variant  + ".tab"
-	reference_path = ref_path + "/" + variant_fasta
-	with open('runme.sh','w+') as runme:
-		subprocess.call("snippy-multi " + str(snippy_input_file) + " --ref " + str(reference_path) + " --cpus 16", shell=True, stdout=runme)
-	subprocess.call("sh runme.sh", shell=True)
-	os.chdir("../")
-	return snippy_version
-
-def combine_output(variant, Pango_Output_VOCI, df):
-	'''Combining output into one dataframe as we loop through each VOC/VOI'''
+def generate_input_file(variant, file, indexed=False):
+	'''Splits a variant fasta into one fasta per sample and writes the .tab input file for snippy in one go.
+	With indexed the samples are kept in one <variant>/<variant>.samples.fasta with a .fai index instead of loose files,
+	and each sample file is only written while snippy runs on it.'''
+	os.makedirs(variant, exist_ok=True) # create directory for each variant
+	variant_dir = os.path.abspath(variant)
+	snippy_input_file = os.path.join(variant, variant + ".tab")  # create snippy input file name
+	tab_lines = []
+	fai_lines = []
+	seen = set()
+	skipped = 0
+	if indexed == True:
+		samples_fasta = open(samples_fasta_name(variant), "wb")
+		offset = 0
+	for header, seq in read_fasta(file):
+		fields = header.split("|")
+		if len(fields) < 2 or fields[1] == "" or fields[1] in seen: # the GISAID ID is the second field, skip headers without one and repeats
+			skipped = skipped + 1
+			continue
+		sample = fields[1]
+		seen.add(sample)
+		sample_path = os.path.join(variant_dir, sample + ".fasta")
+		if indexed == True:
+			record_header = (">" + sample + " " + header + "\n").encode()
+			offset = offset + len(record_header)
+			samples_fasta.write(record_header + seq.encode() + b"\n")
+			fai_lines.append("{}\t{}\t{}\t{}\t{}\n".format(sample, len(seq), offset, len(seq), len(seq) + 1))
+			offset = offset + len(seq) + 1
+		else:
+			with open(sample_path, "w", newline='\n') as f:
+				f.write(">" + header + "\n" + seq + "\n")
+		tab_lines.append(sample + "\t" + sample_path + "\n")
+	if indexed == True:
+		samples_fasta.close()
+		with open(samples_fasta_name(variant) + ".fai", "w", newline='\n') as f:
+			f.writelines(fai_lines)
+	with open(snippy_input_file, "w", newline='\n') as f:
+		f.writelines(tab_lines)
+	if skipped > 0:
+		print(CRED + " {} sequences in {} had no GISAID ID or a repeated one and were skipped.\n".format(skipped, file) + CEND)
+
+def samples_fasta_name(variant):
+	'''Returns the name of the indexed fasta that holds all the samples of a variant.'''
+	return os.path.join(variant, variant + ".samples.fasta")
+
+def read_fai(fai):
+	'''Reads a .fai index into a dictionary of sequence name -> (offset, length). Sequences are expected on one line.'''
+	index = {}
+	with open(fai) as f:
+		for line in f:
+			name, length, offset = line.split("\t")[:3]
+			index[name] = (int(offset), int(length))
+	return index
+
+def write_indexed_sample(samples_fasta, offset, length, sample, sample_path):
+	'''Writes one sample from the indexed samples fasta to its own fasta file.'''
+	with open(samples_fasta, "rb") as f:
+		f.seek(offset)
+		seq = f.read(length)
+	with open(sample_path, "wb") as f:
+		f.write(b">" + sample.encode() + b"\n" + seq + b"\n")
+
+def snippy_jobs(ref_path, VOC_VOI_list, cpus_per_job):
+	'''Builds the snippy command for every sample of every VOC/VOI from the <variant>/<variant>.tab files.
+	Samples that already have a snps.tab are skipped so a run can be resumed. Jobs are ordered so the VOC/VOI with the most genomes goes first.'''
+	jobs = {}
+	samples = {}
+	for variant in VOC_VOI_list:
+		reference_path = os.path.join(ref_path, variant + ".fasta")
+		jobs[variant] = []
+		samples[variant] = []
+		index = {}
+		if os.path.exists(samples_fasta_name(variant) + ".fai"): # samples were stored in one indexed fasta
+			index = read_fai(samples_fasta_name(variant) + ".fai")
+		with open(os.path.join(variant, variant + ".tab")) as f:
+			for line in f:
+				sample, fasta = line.rstrip("\n").split("\t")
+				samples[variant].append(sample)
+				if os.path.exists(os.path.join(variant, sample, "snps.tab")):
+					continue
+				cmd = ["snippy", "--outdir", sample, "--ctgs", fasta, "--ref", reference_path, "--cpus", str(cpus_per_job), "--force"]
+				indexed_sample = None
+				if sample in index:
+					indexed_sample = (samples_fasta_name(variant),) + index[sample] + (sample, fasta)
+				jobs[variant].append((cmd, indexed_sample))
+	order = sorted(VOC_VOI_list, key=lambda variant: len(samples[variant]), reverse=True)
+	return order, jobs, samples
+
+def run_job(cmd, cwd, log, indexed_sample=None):
+	'''Runs one command in the cwd directory, writing its output to log. Returns the exit code.
+	If indexed_sample is given the sample fasta is written from the indexed samples fasta first and removed afterwards.'''
+	if indexed_sample is not None:
+		write_indexed_sample(*indexed_sample)
+	try:
+		with open(os.path.join(cwd, log), "w") as f:
+			return subprocess.call(cmd, cwd=cwd, stdout=f, stderr=subprocess.STDOUT)
+	finally:
+		if indexed_sample is not None:
+			os.remove(indexed_sample[-1])
+
+def run_snippy(ref_path, VOC_VOI_list, threads, cpus_per_job, on_variant_done=None):
+	'''Runs Snippy on each sample of every VOC/VOI through one pool of threads/cpus_per_job workers, then snippy-core on each VOC/VOI once its samples are done.
+	Every job runs with cwd set to the variant directory instead of changing the working directory, so jobs can run side by side.
+	If on_variant_done is given it is called with the variant as soon as its core.txt is written. Returns the number of snippy jobs run.'''
+	order, jobs, samples = snippy_jobs(ref_path, VOC_VOI_list, cpus_per_job)
+	workers = threads // cpus_per_job if threads > cpus_per_job else 1
+	num_jobs = len([job for variant in order for job in jobs[variant]])
+	print(CYEL + "Running {} snippy jobs with {} at a time using {} cpus each.\n".format(num_jobs, workers, cpus_per_job) + CEND)
+	remaining = {variant: len(jobs[variant]) for variant in order}
+	with ThreadPoolExecutor(max_workers=workers) as pool:
+		futures = {}
+		for variant in order:
+			if remaining[variant] == 0: # everything was already done on a previous run, its snippy-core goes first
+				futures[pool.submit(run_snippy_core, ref_path, variant, samples[variant])] = (variant, None)
+		for variant in order:
+			for cmd, indexed_sample in jobs[variant]:
+				futures[pool.submit(run_job, cmd, variant, cmd[2] + ".log", indexed_sample)] = (variant, cmd[2])
+		pending = set(futures)
+		try:
+			while len(pending) > 0:
+				done, pending = wait(pending, return_when=FIRST_COMPLETED)
+				for future in done:
+					variant, sample = futures[future]
+					if sample is None: # snippy-core finished
+						if future.result() != 0:
+							print(CRED + " snippy-core failed for the variant {}, see {}/core.log.\n".format(variant, variant) + CEND)
+						elif on_variant_done is not None:
+							on_variant_done(variant)
+						continue
+					if future.result() != 0:
+						print(CRED + " snippy failed on {} for the variant {}, see {}/{}.log.\n".format(sample, variant, variant, sample) + CEND)
+					remaining[variant] = remaining[variant] - 1
+					if remaining[variant] == 0:
+						core_future = pool.submit(run_snippy_core, ref_path, variant, samples[variant])
+						futures[core_future] = (variant, None)
+						pending.add(core_future)
+		except BaseException: # a failed callback, Ctrl-C or a kill from SGE, do not start the jobs still queued
+			pool.shutdown(wait=True, cancel_futures=True)
+			raise
+	return num_jobs
+
+def run_snippy_core(ref_path, variant, samples):
+	'''Runs snippy-core on the finished samples of a VOC/VOI to make <variant>/core.txt'''
+	reference_path = os.path.join(ref_path, variant + ".fasta")
+	finished = [sample for sample in samples if os.path.exists(os.path.join(variant, sample, "snps.tab"))]
+	cmd = ["snippy-core", "--ref", reference_path, "--prefix", "core"] + finished
+	return run_job(cmd, variant, "core.log")
+
+def combine_output(variant, Variant_df):
+	'''Combines the snippy output of one VOC/VOI with its rows in the pangolin report. Variant_df needs the ID column made in get_file.'''
 	Snippy_Output = pd.read_csv(variant + '/core.txt', sep='\t', header=0) # open file from snippy
-	seq_list = Snippy_Output['ID'].tolist()
-	Pango_Output_VOCI["ID"] = Pango_Output_VOCI.taxon.str.split("|").str[1]
-	Pango_30_df = Pango_Output_VOCI[Pango_Output_VOCI['ID'].isin(seq_list)] # reduce dataframe to sequences that were run through snippy
-	Combined = Pango_30_df.merge(Snippy_Output, how='inner', on='ID')
+	Combined = Variant_df.merge(Snippy_Output, how='inner', on='ID') # reduce dataframe to sequences that were run through snippy
 	Combined = Combined.sort_values(["VARIANT", "LOWCOV"])
-	df_merge = df.append(Combined, ignore_index=True)
-	return df_merge
+	return Combined
 
-def Check_and_add_stats(df_merge):
-	SRR_Checked = ID_check(df_merge)
+def Check_and_add_stats(df_SRR, df_merge):
+	SRR_Checked = ID_check(df_SRR, df_merge)
 	df_cal_stats = cal_stats(SRR_Checked)
 	df_cal_stats.to_csv('Pango_Random_Genomes_Stats.tsv', sep='\t', index=False)
+	return df_cal_stats
+
+def load_mapping(mapping_file, cache_dir):
+	'''Reads the GISAID_ID to SRR_ID mapping file, all of its columns are kept.'''
+	return load_table(mapping_file, '\t', MAPPING_DTYPES, cache_dir, all_columns=True)
 
-def ID_check(mapping_file):
-	'''Removes duplicate SRR and GISAID_IDs from dataset.'''
-	df = pd.read_csv('Pango_Random_Genomes.csv', sep='\t', header=0)
+def ID_check(df_SRR, df_merge, verbose=True):
+	'''Removes duplicate SRR and GISAID_IDs from dataset. df_SRR is the mapping file read with load_mapping.'''
+	df = df_merge # this is what was written to Pango_Random_Genomes.csv so there is no need to read it back
 	rom_num = df.shape[0]
 	df = df.drop_duplicates('ID') # drop rows with duplicate GISAID_IDs
-	print(CYEL + "There were {} rows that had duplicate GSAID IDs.".format((rom_num - df.shape[0])) + CEND)
-	df.rename(columns = {'ID':'GISAID_ID'}, inplace = True) # change column names for merging
-	df_SRR = pd.read_csv(mapping_file, sep='\t', header=0)
+	df = df.rename(columns = {'ID':'GISAID_ID'}) # change column names for merging
 	SRR_Check = df.merge(df_SRR, how='inner', on='GISAID_ID') # merge 
 	SRR_Checked = SRR_Check.drop_duplicates('SRR_ID') # drop rows with duplicate SRRs
-	print(CYEL + "There were {} rows that had duplicate SRR IDs.".format((SRR_Check.shape[0] - SRR_Checked.shape[0])) + CEND)
+	if verbose == True:
+		print(CYEL + "There were {} rows that had duplicate GSAID IDs.".format((rom_num - df.shape[0])) + CEND)
+		print(CYEL + "There were {} rows that had duplicate SRR IDs.".format((SRR_Check.shape[0] - SRR_Checked.shape[0])) + CEND)
 	return SRR_Checked
 
-def cal_stats(SRR_Checked):
-	'''Calculates Range and Average for SNPs and Low Coverage Regions'''
+def file_sha256(path):
+	'''Returns the sha256 of a file, read in chunks.'''
+	sha = hashlib.sha256()
+	with open(path, "rb") as f:
+		for chunk in iter(lambda: f.read(1024 * 1024), b""):
+			sha.update(chunk)
+	return sha.hexdigest()
+
+def load_table(path, sep, dtypes, cache_dir, all_columns=False):
+	'''Reads a csv/tsv with the dtypes given. Only the columns in dtypes are read unless all_columns is set, then the other columns are read as strings.
+	If cache_dir is set the parsed table is kept there as parquet, keyed on the size, mtime and sha256 of the source file.
+	A changed mtime with the same sha256 still uses the cache, a cache that can not be read is made again. Without pyarrow the table is just parsed each time.'''
+	if all_columns == True:
+		usecols = None
+		read_dtypes = dtypes.copy()
+		read_dtypes.update({col: "string" for col in pd.read_csv(path, sep=sep, nrows=0).columns if col not in dtypes})
+	else:
+		usecols = lambda col: col in dtypes # older pangolin reports do not have every column
+		read_dtypes = dtypes
+	if cache_dir is None:
+		return pd.read_csv(path, sep=sep, header=0, usecols=usecols, dtype=read_dtypes)
+	os.makedirs(cache_dir, exist_ok=True)
+	cache_name = os.path.join(cache_dir, os.path.basename(path) + "." + hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:12])
+	stat = os.stat(path)
+	key = {"source": os.path.abspath(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "dtypes": read_dtypes}
+	if os.path.exists(cache_name + ".json") and os.path.exists(cache_name + ".parquet"):
+		try:
+			with open(cache_name + ".json") as f:
+				cached_key = json.load(f)
+			sha256 = cached_key.pop("sha256", None)
+			if cached_key == key:
+				return pd.read_parquet(cache_name + ".parquet")
+			if cached_key.get("size") == key["size"] and cached_key.get("dtypes") == key["dtypes"] and file_sha256(path) == sha256: # only the mtime changed
+				table = pd.read_parquet(cache_name + ".parquet")
+				key["sha256"] = sha256
+				write_json(key, cache_name + ".json")
+				return table
+		except (OSError, ValueError, ImportError) as e: # a truncated file from a killed job, pyarrow.lib.ArrowInvalid is a ValueError
+			print(CRED + " Could not read the cached copy of {} ({}), it will be parsed again.\n".format(path, e) + CEND)
+	table = pd.read_csv(path, sep=sep, header=0, usecols=usecols, dtype=read_dtypes)
+	try:
+		write_cache(table, key, path, cache_name)
+	except ImportError:
+		print(CRED + " pyarrow is not installed so {} was not cached.\n".format(path) + CEND)
+	return table
+
+def write_cache(table, key, path, cache_name):
+	'''Writes the parsed table and its key with the sha256 of the source file to temporary files and moves them into place, parquet first,
+	so a job killed while writing or two jobs sharing the cache never leave a broken parquet next to a matching key.'''
+	tmp_file = cache_name + ".parquet.{}.tmp".format(os.getpid())
+	try:
+		table.to_parquet(tmp_file, index=False)
+		os.replace(tmp_file, cache_name + ".parquet")
+	finally:
+		if os.path.exists(tmp_file):
+			os.remove(tmp_file)
+	key["sha256"] = file_sha256(path)
+	write_json(key, cache_name + ".json")
+
+def write_json(data, json_file):
+	'''Writes json to a temporary file and moves it into place.'''
+	tmp_file = json_file + ".{}.tmp".format(os.getpid())
+	try:
+		with open(tmp_file, "w") as f:
+			json.dump(data, f)
+		os.replace(tmp_file, json_file)
+	finally:
+		if os.path.exists(tmp_file):
+			os.remove(tmp_file)
+
+def p5(values):
+	return values.quantile(0.05)
+
+def p95(values):
+	return values.quantile(0.95)
+
+def lineage_stats(SRR_Checked):
+	'''Calculates the mean, range, median, 5th and 95th percentiles and count of SNPs and Low Coverage Regions for each lineage with one groupby.'''
 	col_list = ["VARIANT", "LOWCOV"]
+	values = SRR_Checked[['lineage']].copy()
 	for col in col_list:
-		SRR_Checked[col] = pd.to_numeric(SRR_Checked[col]) # make column numeric
-		df = SRR_Checked.groupby('lineage', as_index=False)[col].mean().round(2)
-		Variant_Min = SRR_Checked.groupby('lineage', as_index=False)[col].min().astype(str)
-		Variant_Max = SRR_Checked.groupby('lineage', as_index=False)[col].max().astype(str)
-		Variant_Max["Range"] = Variant_Min[col] + "-" + Variant_Max[col]
-		Variant_Range = Variant_Max.drop(columns=[col])
-		df = df.merge(Variant_Range, how='inner', on='lineage') # merge 
-		Mean = col +"_mean"
-		Range = col +"_Range"
-		df.rename(columns = {col:Mean, 'Range':Range}, inplace = True) # change column names for merging
-		SRR_Checked = SRR_Checked.merge(df, how='inner', on='lineage') # merge 
+		values[col] = pd.to_numeric(SRR_Checked[col]) # make column numeric
+	grouped = values.groupby('lineage', observed=True)[col_list].agg(['mean', 'min', 'max', 'median', p5, p95, 'count'])
+	df = pd.DataFrame({'lineage': grouped.index.astype(str)})
+	for col in col_list:
+		df[col + "_mean"] = grouped[(col, 'mean')].round(2).values
+		df[col + "_Range"] = (grouped[(col, 'min')].astype(str) + "-" + grouped[(col, 'max')].astype(str)).values
+		df[col + "_median"] = grouped[(col, 'median')].values
+		df[col + "_p5"] = grouped[(col, 'p5')].round(2).values
+		df[col + "_p95"] = grouped[(col, 'p95')].round(2).values
+		df[col + "_count"] = grouped[(col, 'count')].values
+	return df
+
+def cal_stats(SRR_Checked):
+	'''Calculates Range, Average, median, percentiles and counts for SNPs and Low Coverage Regions and adds them to each row of their lineage.'''
+	df = lineage_stats(SRR_Checked)
+	df.to_csv(LINEAGE_STATS_FILE, sep='\t', index=False)
+	SRR_Checked = SRR_Checked.astype({'lineage': str}).merge(df, how='inner', on='lineage') # merge 
 	return SRR_Checked
 
+def stop_on_sigterm(signum, frame):
+	'''SGE sends SIGTERM when a job is killed, raise so the queued snippy jobs are cancelled and the manifest is written.'''
+	raise SystemExit(128 + signum)
+
 def main():
 	args = parse_cmdline()
-	df_merge = get_file(args.variants, args.ref_path, args.pangolin_input, args.all_samples, args.seq_num, args.random_only, args.full_fasta)
-	Check_and_add_stats(args.mapping_file,df_merge)
+	signal.signal(signal.SIGTERM, stop_on_sigterm)
+	manifest = RunManifest("Generate_fasta.py", vars(args), args.manifest, args.profile)
+	manifest.probe_versions(TOOL_VERSIONS, PACKAGES)
+	try:
+		with manifest.stage("load mapping") as stage:
+			df_SRR = load_mapping(args.mapping_file, args.cache_dir) # read once, the live stats and the final stats use it
+			stage["records"] = len(df_SRR)
+		df_merge = get_file(args, manifest, df_SRR)
+		with manifest.stage("stats") as stage:
+			stage["records"] = len(Check_and_add_stats(df_SRR, df_merge))
+	except BaseException:
+		manifest.write("failed") # keep the stages that finished so a failed SGE job can still be looked at
+		raise
+	manifest.write()
+	print(CYEL + "Wrote the run manifest to {}.\n".format(args.manifest) + CEND)
 
 if __name__ == '__main__':
 	main()
@@ -6,24 +6,38 @@
 ## https://github.com/jvhagey/
 ## 2021
 
-## This script requires the selenium package which will need to have a driver installed see the following link:
-# https://pypi.org/project/selenium/
-## This driver will need to be added to your path following the following instructions:
-# https://zwbetz.com/download-chromedriver-binary-and-add-to-your-path-for-automated-functional-testing/
-# Or see alternative option on line 49
+## This script uses the NCBI E-utilities (https://www.ncbi.nlm.nih.gov/books/NBK25501/) to get the SRA metadata for each SRR.
+## Set NCBI_API_KEY in your environment to be allowed 10 requests per second instead of 3.
 
 # importing packages
 from numpy import *
+import os, re, time, asyncio, sqlite3
+import xml.etree.ElementTree as ET
 import pandas as pd
-from selenium import webdriver
+import aiohttp
 from argparse import ArgumentParser
+from run_manifest import RunManifest
 
+EFETCH_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
+RETRY_BACKOFF = 1 # seconds to wait after the first failed request, doubled after each one
+PRIMER_RULES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "primer_rules.tsv")
+ARTIC_UNKNOWN_VERSION = "Artic unknown version" # the primers primer_rules.tsv gives descriptions that say ARTIC without a version
+PACKAGES = ["numpy", "pandas", "aiohttp"] # versions recorded in the run manifest
 
 def parse_cmdline():
 	"""Parse command-line arguments for script."""
-	parser = ArgumentParser(prog="NCBI_Grabbing.py", description="""This script will take in and ID file and go scrap the information from the ncbi SRR site.""")
+	parser = ArgumentParser(prog="NCBI_Grabbing.py", description="""This script will take in and ID file and get the information for each SRR from the ncbi SRA.""")
 	parser.add_argument("-f", "--ID-file", dest="IDs", action="store", default=False, required=True, help="A full path to the mapping file that is tab delimited with at columns GISAID_ID and SRR_ID.")
 	parser.add_argument("-p", "--pango-file", dest="pango", action="store", default=False, required=True, help="The full path to Pango_Random_Genomes_Stats.tsv file that came out of Generate_Random_Genomes.py.")
+	parser.add_argument("-u", "--url", dest="url", action="store", default=EFETCH_URL, required=False, help="The EFetch url to get SRA xml from, change this to point at a mirror or a local test server.")
+	parser.add_argument("-w", "--workers", dest="workers", action="store", type=int, default=3, required=False, help="The number of requests that can be waiting on ncbi at once.")
+	parser.add_argument("-b", "--batch-size", dest="batch_size", action="store", type=int, default=200, required=False, help="The number of SRRs asked for in each request.")
+	parser.add_argument("-c", "--cache", dest="cache_file", action="store", default="sra_cache.sqlite", required=False, help="The sqlite file that keeps the SRA information already fetched.")
+	parser.add_argument("-t", "--ttl-days", dest="ttl_days", action="store", type=float, default=30, required=False, help="SRRs fetched more than this many days ago are fetched again, use 0 to fetch everything again.")
+	parser.add_argument("-o", "--offline", dest="offline", action="store_true", default=False, required=False, help="Only use the SRA information in the cache, nothing is fetched from ncbi.")
+	parser.add_argument("--manifest", dest="manifest", action="store", default="NCBI_Scraping_manifest.json", required=False, help="Json file where the package versions and the time, cpu, memory and bytes read/written of each stage are written.")
+	parser.add_argument("--profile", dest="profile", action="store", default=None, required=False, help="Also write cProfile stats of the run to this file, read them with python -m pstats.")
+	parser.add_argument("-r", "--primer-rules", dest="primer_rules", action="store", default=PRIMER_RULES, required=False, help="Tab separated file with the ordered rules used to name the primer scheme, see primer_rules.tsv next to this script.")
 	args = parser.parse_args()
 	return args
 
@@ -32,86 +46,196 @@ CRED = '\033[91m' + '\nWarning:'
 CYEL = '\033[93m'
 CEND = '\033[0m'
 
-pd.set_option("max_columns", None)
-pd.set_option("max_rows", None)
+pd.set_option("display.max_columns", None)
+pd.set_option("display.max_rows", None)
 
-def NCBI_grab(IDs):
-	""" This function goes to the ncbi website and clicks the download button to get a .csv file that has the path
-	web address for each genome. """
-	df = pd.DataFrame(columns = ["SRR", "BioSample", "Layout", "Instrument", "Primers", "Protocol"]) # creating empty dataframe for later
-	count = 0
-	Design = ""
+class RateLimiter:
+	"""Spaces out the start of requests so no more than rate requests are sent each second."""
+	def __init__(self, rate):
+		self.interval = 1.0 / rate
+		self.next_time = 0.0
+		self.lock = asyncio.Lock()
+
+	async def wait(self):
+		async with self.lock:
+			now = time.monotonic()
+			if self.next_time > now:
+				await asyncio.sleep(self.next_time - now)
+				now = self.next_time
+			self.next_time = now + self.interval
+
+async def fetch_batch(session, url, SRRs, limiter, api_key, retries=5):
+	"""Posts one batch of SRRs to EFetch and returns the xml text. Failed requests are retried with exponential backoff."""
+	data = {"db": "sra", "id": ",".join(SRRs), "rettype": "xml"}
+	if api_key:
+		data["api_key"] = api_key
+	for attempt in range(retries):
+		await limiter.wait()
+		try:
+			async with session.post(url, data=data) as response:
+				if response.status == 200:
+					return await response.text()
+				error = "HTTP {}".format(response.status)
+		except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+			error = repr(e)
+		print(CRED + " request for {} SRRs failed with {} (attempt {} of {}).".format(len(SRRs), error, attempt + 1, retries) + CEND)
+		await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+	raise RuntimeError("Could not get {} from {} after {} attempts.".format(",".join(SRRs), url, retries))
+
+def parse_sra_xml(xml_text):
+	"""Parses an EXPERIMENT_PACKAGE_SET from EFetch into one row per run with the SRR, BioSample, Layout, Instrument, Primers and Protocol."""
+	rows = []
+	for package in ET.fromstring(xml_text).iter("EXPERIMENT_PACKAGE"):
+		BioSample = ""
+		for external_id in package.iterfind("SAMPLE/IDENTIFIERS/EXTERNAL_ID"):
+			if external_id.get("namespace") == "BioSample":
+				BioSample = external_id.text.strip()
+		layout = package.find("EXPERIMENT/DESIGN/LIBRARY_DESCRIPTOR/LIBRARY_LAYOUT")
+		Layout = layout[0].tag if layout is not None and len(layout) > 0 else "Unknown"
+		Instrument = package.findtext("EXPERIMENT/PLATFORM/*/INSTRUMENT_MODEL", default="Unknown").strip()
+		attributes = {attribute.findtext("TAG", default=""): attribute.findtext("VALUE", default="").strip() for attribute in package.iterfind("SAMPLE/SAMPLE_ATTRIBUTES/SAMPLE_ATTRIBUTE")}
+		Design = package.findtext("EXPERIMENT/DESIGN/LIBRARY_DESCRIPTOR/LIBRARY_CONSTRUCTION_PROTOCOL", default="")
+		Design = Design.replace("ILLUMINA_DNA_PREP|", "").strip()
+		Protocol = "Unknown"
+		if "artic_protocol_version" in attributes:
+			Protocol = "artic_protocol_version " + attributes["artic_protocol_version"]
+		if Design == "" or "nextera" in Design.lower(): # the library kit does not tell us the primers so look elsewhere
+			if "artic_primer_version" in attributes:
+				Design = "artic_primer_version " + attributes["artic_primer_version"]
+			elif package.findtext("EXPERIMENT/DESIGN/DESIGN_DESCRIPTION", default="").strip() != "":
+				Design = package.findtext("EXPERIMENT/DESIGN/DESIGN_DESCRIPTION").strip()
+			else:
+				Design = "Unknown"
+		for run in package.iterfind("RUN_SET/RUN"):
+			rows.append({'SRR': run.get("accession"), 'BioSample': BioSample, 'Layout': Layout, 'Instrument': Instrument, 'Primers': Design, 'Protocol': Protocol})
+	return rows
+
+async def fetch_all(SRRs, url, workers, batch_size, api_key, on_batch=None):
+	"""Fetches all SRRs in batches with a pool of workers sharing one http session and one rate limit.
+	on_batch is called with the rows of each batch as soon as it is parsed, so they can be saved before the other batches finish.
+	A batch that still fails after its retries does not stop the other batches, the first error is raised once they are all done."""
+	limiter = RateLimiter(10 if api_key else 3)
+	queue = asyncio.Queue()
+	for i in range(0, len(SRRs), batch_size):
+		queue.put_nowait(SRRs[i:i + batch_size])
+	rows = []
+	errors = []
+	async def worker(session):
+		while not queue.empty():
+			batch = queue.get_nowait()
+			try:
+				xml_text = await fetch_batch(session, url, batch, limiter, api_key)
+			except RuntimeError as e:
+				errors.append(e)
+				continue
+			wanted = set(batch)
+			found = [row for row in parse_sra_xml(xml_text) if row['SRR'] in wanted] # an experiment can have more runs than we asked for
+			rows.extend(found)
+			if on_batch is not None:
+				on_batch(found)
+			print(CYEL + "Got info for {} of {} SRRs, {} done so far.".format(len(found), len(batch), len(rows)) + CEND)
+	async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=300)) as session:
+		await asyncio.gather(*[worker(session) for _ in range(workers)])
+	if len(errors) > 0:
+		raise errors[0]
+	return rows
+
+SRA_COLUMNS = ["SRR", "BioSample", "Layout", "Instrument", "Primers", "Protocol"]
+
+def open_cache(cache_file):
+	"""Opens the sqlite file that keeps the SRA information of every SRR fetched before, creating the table if needed."""
+	conn = sqlite3.connect(cache_file)
+	conn.execute("CREATE TABLE IF NOT EXISTS sra_runs (SRR TEXT PRIMARY KEY, BioSample TEXT, Layout TEXT, Instrument TEXT, Primers TEXT, Protocol TEXT, fetched_at REAL)")
+	return conn
+
+def read_cache(conn, SRRs):
+	"""Returns a dictionary of SRR -> (row, fetched_at) for the SRRs that are in the cache."""
+	cached = {}
+	for i in range(0, len(SRRs), 500): # stay under the sqlite limit on query parameters
+		chunk = SRRs[i:i + 500]
+		query = "SELECT {}, fetched_at FROM sra_runs WHERE SRR IN ({})".format(", ".join(SRA_COLUMNS), ", ".join("?" * len(chunk)))
+		for record in conn.execute(query, chunk):
+			cached[record[0]] = (dict(zip(SRA_COLUMNS, record[:-1])), record[-1])
+	return cached
+
+def write_cache(conn, rows, fetched_at):
+	"""Adds or replaces the rows in the cache with the time they were fetched."""
+	with conn:
+		conn.executemany("INSERT OR REPLACE INTO sra_runs VALUES (?, ?, ?, ?, ?, ?, ?)", [[row[col] for col in SRA_COLUMNS] + [fetched_at] for row in rows])
+
+def NCBI_grab(IDs, url=EFETCH_URL, workers=3, batch_size=200, cache_file="sra_cache.sqlite", ttl_days=30, offline=False):
+	""" This function gets the SRA xml for each SRR in the IDs file from EFetch and pulls out the BioSample, Layout, Instrument, Primers and Protocol.
+	SRRs already in cache_file that were fetched less than ttl_days ago are not fetched again. With offline nothing is fetched and only the cache is used. """
 	with open(IDs) as file:
-		for SRR in file:
-			driver = webdriver.Chrome()  # Alternatively you can change this to driver webdriver.Chrome(executable_path="C:\\chromedriver.exe")
-			driver.get("https://www.ncbi.nlm.nih.gov/sra/") # get to gsaid login page
-			driver.find_element_by_id("term").send_keys(SRR) # enter login info
-			driver.find_element_by_id('search').click()
-			BioSample = driver.find_element_by_xpath("//a[@title='Link to BioSample']").text
-			BioSample = BioSample.replace("\n","")
-			details = driver.find_element_by_xpath('//*[@id="ResultView"]/div[@class="expand showed sra-full-data"]/div').text
-			lines = details.splitlines()
-			Protocol = "Unknown"
-			for line in lines:
-				if line.startswith("Layout"):
-					Layout = line.split(": ")[1]
-				if line.startswith("Instrument"):
-					Instrument = line.split(": ")[1]
-				if line.startswith("Construction protocol"):
-					Design = line.split(": ")[1]
-					Design = line.replace("ILLUMINA_DNA_PREP|","")
-					Design = Design.replace("Construction protocol: ", "")
-			if Design == "" or any(substring in Design for substring in ["NEXTERA", "Nextera", "nextera"]):
-				design_element = driver.find_element_by_xpath('//*[@id="ResultView"]/div[@class="sra-full-data"]').text
-				design_lines = design_element.splitlines()
-				for line in design_lines:
-					if not line.startswith("Design"):
-						design_element = driver.find_element_by_xpath('//*[@id="ResultView"]/div[5]').text
-						design_lines = design_element.splitlines()
-						for line in design_lines:
-							if line.startswith("artic_primer_version"):
-								Design = line.replace(":", "")
-							if line.startswith("artic_protocol_version"):
-								Protocol = line.replace(":", "")
-					elif line.startswith("Design"):
-						Design = line.replace("Design:", "")
-					else:
-						Design = "Unknown"
-			count = count + 1
-			print(CYEL + "Got info for {}, which is the {} sequence.".format(BioSample, count) + CEND)
-			new_row = {'SRR': SRR, 'BioSample': BioSample, 'Layout': Layout, 'Instrument': Instrument, 'Primers': Design, 'Protocol': Protocol}
-			print(new_row)
-			df = df.append(new_row, ignore_index=True)
-			driver.close
-		print(CYEL+ "Retrieved information for {} SRRs".format(count) + CEND)
-		#df.to_csv('NCBI_Info_Larger.csv', sep=',', index=False)
-		return df
-
-def clean_table(NCBI_Info_Larger):
-	""" This function cleans the datatable to convert all possible versions encountered of saying Artic V3 primers. There are probably other cases of different ways this is input, but that is a manual process to identify along the way."""
+		SRRs = list(dict.fromkeys(line.strip() for line in file if line.strip() != "")) # drop blank lines and repeats, keep the order
+	conn = open_cache(cache_file)
+	cached = read_cache(conn, SRRs)
+	oldest = time.time() - ttl_days * 86400
+	if offline == True:
+		to_fetch = []
+	else:
+		to_fetch = [SRR for SRR in SRRs if SRR not in cached or cached[SRR][1] < oldest]
+	print(CYEL + "{} of {} SRRs are in {}, fetching {}.".format(len(cached), len(SRRs), cache_file, len(to_fetch)) + CEND)
+	def save_batch(rows): # every batch goes into the cache as it arrives so a failed run keeps what it fetched
+		fetched_at = time.time()
+		write_cache(conn, rows, fetched_at)
+		cached.update({row['SRR']: (row, fetched_at) for row in rows})
+	try:
+		if len(to_fetch) > 0:
+			asyncio.run(fetch_all(to_fetch, url, workers, batch_size, os.environ.get("NCBI_API_KEY"), save_batch))
+	finally:
+		conn.close()
+	df = pd.DataFrame([cached[SRR][0] for SRR in SRRs if SRR in cached], columns = SRA_COLUMNS)
+	missing = set(SRRs) - set(df['SRR'])
+	if len(missing) > 0:
+		print(CRED + " No SRA information was found for {} SRRs: {}".format(len(missing), ", ".join(sorted(missing))) + CEND)
+	print(CYEL+ "Retrieved information for {} SRRs".format(df.shape[0]) + CEND)
+	#df.to_csv('NCBI_Info_Larger.csv', sep=',', index=False)
+	return df
+
+def load_primer_rules(rules_file):
+	"""Reads the ordered primer rules (rule, primers, regex pattern) from a tab separated file. Lines starting with # are skipped."""
+	rules = []
+	with open(rules_file) as f:
+		lines = [line.rstrip("\n") for line in f if line.strip() != "" and not line.startswith("#")]
+	for line in lines[1:]: # first line is the header
+		rule, primers, pattern = line.split("\t")
+		rules.append((rule, primers, re.compile(pattern, re.IGNORECASE)))
+	return rules
+
+def classify_primers(Primers, rules):
+	"""Names the primer scheme for each description in the Primers column with the first rule that matches.
+	Each distinct description is only checked against the rules once. Returns the primers and the rule that matched for every row."""
+	codes, descriptions = pd.factorize(Primers.fillna(""))
+	matches = []
+	for description in descriptions:
+		match = ("Unknown", "no_match")
+		for rule, primers, pattern in rules:
+			if pattern.search(description):
+				match = (primers, rule)
+				break
+		matches.append(match)
+	names = array([match[0] for match in matches] + ["Unknown"], dtype=object) # the extra entry is for missing values, which factorize codes as -1
+	rule_names = array([match[1] for match in matches] + ["no_match"], dtype=object)
+	return pd.Series(names[codes], index=Primers.index), pd.Series(rule_names[codes], index=Primers.index)
+
+def clean_table(NCBI_Info_Larger, rules_file=PRIMER_RULES):
+	""" This function cleans the datatable to name the primer scheme from all the different ways it is written in the SRA, using the rules in rules_file.
+	The rule that matched is kept in the Primer_rule column. Descriptions no rule matches are printed so new rules can be added."""
 	#NCBI_info = pd.read_csv('NCBI_Info_Larger.csv', sep=',', header=0)
 	NCBI_info = NCBI_Info_Larger
 	NCBI_info['SRR'] = NCBI_info['SRR'].str.replace("\n", "")
-	NCBI_info['Primers'] = NCBI_info['Primers'].replace({' Whole genome sequencing of SARS-CoV-2 using the Artic protocol V3 and Illumina MiSeq':'Artic protocol V3',
-	                                                     ' Whole genome sequencing of SARS-CoV-2 using the Artic protocol V3 and Oxford Nanopore GridION sequencing':'Artic protocol V3',
-	                                                     ' Illumina NovaSeq 6000 amplicon sequencing. Samples prepared and sequenced by The Lighthouse Lab in Milton Keynes and Alex Alderton, Roberto Amato, Sonia Goncalves, Ewan Harrison, David K. Jackson, Ian Johnston, Dominic Kwiatkowski, Cordelia Langford, John Sillitoe on behalf of the Wellcome Sanger Institute COVID-19 Surveillance Team (http://www.sanger.ac.uk/covid-team)': 'Unknown',
-	                                                     ' Illumina NovaSeq 6000 amplicon sequencing. Samples prepared and sequenced by Rob Howes, The Lighthouse Lab in Cambridge and Alex Alderton, Roberto Amato, Jeffrey Barrett, Sonia Goncalves, Ewan Harrison, David K. Jackson, Ian Johnston, Dominic Kwiatkowski, Cordelia Langford, John Sillitoe on behalf of the Wellcome Sanger Institute COVID-19 Surveillance Team (https://www.sanger.ac.uk/covid-team)': 'Unknown',
-	                                                     ' Illumina NovaSeq 6000 amplicon sequencing. Samples prepared and sequenced by Harper VanSteenhouse, Yumi Kasai, David Gray, Carol Clugston, Anna Dominiczak and Alex Alderton, Roberto Amato, Jeffrey Barrett, Sonia Goncalves, Ewan Harrison, David K. Jackson, Ian Johnston, Dominic Kwiatkowski, Cordelia Langford, John Sillitoe on behalf of the Wellcome Sanger Institute COVID-19 Surveillance Team (https:// www.sanger.ac.uk/covid-team)': 'Unknown',
-	                                                     ' Illumina NovaSeq 6000 amplicon sequencing. Samples prepared and sequenced by Jacquelyn Wynn, Mairead Hyland, The Lighthouse Lab in Alderley Park and Alex Alderton, Roberto Amato, Jeffrey Barrett, Sonia Goncalves, Ewan Harrison, David K. Jackson, Ian Johnston, Dominic Kwiatkowski, Cordelia Langford, John Sillitoe on behalf of the Wellcome Sanger Institute COVID-19 Surveillance Team (https://www.sanger.ac.uk/covid-team)': 'Unknown',
-	                                                     ' Illumina NovaSeq 6000 amplicon sequencing. Samples prepared and sequenced by Randox Laboratories and Alex Alderton, Roberto Amato, Jeffrey Barrett, Sonia Goncalves, Ewan Harrison, David K. Jackson, Ian Johnston, Dominic Kwiatkowski, Cordelia Langford, John Sillitoe on behalf of the Wellcome Sanger Institute COVID-19 Surveillance Team (https://www.sanger.ac.uk/covid-team)': 'Unknown',
-	                                                     ' Illumina NovaSeq 6000 amplicon sequencing. Samples prepared and sequenced by The Lighthouse Lab in Milton Keynes and Alex Alderton, Roberto Amato, Jeffrey Barrett, Sonia Goncalves, Ewan Harrison, David K. Jackson, Ian Johnston, Dominic Kwiatkowski, Cordelia Langford, John Sillitoe on behalf of the Wellcome Sanger Institute COVID-19 Surveillance Team (https://www.sanger.ac.uk/covid-team)': 'Unknown',
-	                                                     ' ARTIC Protocol V3 Illumina DNA Flex library prep':'Artic protocol V3', ' ARTIC Protocol V3 - Illumina DNA Flex library prep': 'Artic protocol V3',
-	                                                     ' ARTIC PCR - tiling of viral cDNA(V3), sequenced by Illumina MiSeq with DNA Flex library prep-kit.Only reads aligned to SARS-CoV-2 reference (NC_045512.2) retained.': 'Artic protocol V3',
-	                                                     'artic_primer_version 3': 'Artic protocol V3', " SARS-CoV-2 Sequencing on Illumina MiSeq Using ARTIC Protocol": "Artic protocol V3",
-	                                                     ' ARTIC V3 PCR-tiling of viral cDNA': 'Artic protocol V3',
-	                                                     ' Artic protocol V3': 'Artic protocol V3',
-	                                                     ' ILLUMINA_DNA_PREP | Artic_V3': 'Artic protocol V3',
-	                                                     ' ARTIC v3 amplicons, NexteraXT library, minimap2 v2.17, ivar v1.2, samtools v1.10. Using minimap2, short reads mapped to SARS-CoV-2 NCBI accession MN908947.3. Using samtools, proper_pairs (samflag 2) mapping to MN908947.3 retained, unmapped reads (samflag 4) discarded (to filter out non-SARS-CoV-2 cDNA). Filtered reads submitted to NCBI':'Artic protocol V3',
-	                                                     ' ARTIC V3 amplicons, Nextera XT library, minimap2 v2.17, ivar v1.2.1, samtools v1.10. Using minimap2, short reads mapped to SARS-CoV-2 NCBI accession MN908947.3. Using samtools, proper_pairs (samflag 2) mapping to MN908947.3 retained, unmapped reads (samflag 4) discarded (to filter out non-SARS-CoV-2 cDNA). Filtered reads submitted to NCBI' : 'Artic protocol V3',
-	                                                     ' ARTIC v3, minimap2 v2.17, ivar v1.2.2, samtools v1.10. Using minimap2, short reads mapped to SARS-CoV-2 NCBI accession MN908947.3. Using samtools, proper_pairs (samflag 2) mapping to MN908947.3 retained, unmapped reads (samflag 4) discarded (to filter out non-SARS-CoV-2 cDNA). Filtered reads submitted to NCBI': 'Artic protocol V3',
-	                                                     'Artic_V3': 'Artic protocol V3', " Total RNA from SARS-CoV-2 positive samples was converted to cDNA. Viral whole-genome amplification was performed according to the Artic Network protocol (https://artic.network/ncov-2019) using the SARS-CoV-2 primer scheme (V3).": 'Artic protocol V3'})
+	descriptions = NCBI_info['Primers'].str.strip()
+	NCBI_info['Primers'], NCBI_info['Primer_rule'] = classify_primers(descriptions, load_primer_rules(rules_file))
 	#NCBI_info['Protocol'] = NCBI_info['Protocol'].replace({'artic_protocol_version 3.0': 'Artic protocol V3'})
-	NCBI_info.loc[NCBI_info['Protocol'] == 'artic_protocol_version 3.0', 'Primers'] = 'Artic protocol V3'
+	NCBI_info.loc[NCBI_info['Protocol'] == 'artic_protocol_version 3.0', ['Primers', 'Primer_rule']] = ['Artic protocol V3', 'artic_protocol_version']
+	print(CYEL + "Primer rules matched:\n{}".format(NCBI_info['Primer_rule'].value_counts().to_string()) + CEND)
+	unmatched = descriptions[(NCBI_info['Primer_rule'] == "no_match") & ~descriptions.isin(["", "Unknown"])].value_counts()
+	if len(unmatched) > 0:
+		print(CRED + " {} descriptions did not match any primer rule in {}:\n{}".format(len(unmatched), rules_file, unmatched.to_string()) + CEND)
+	unversioned = descriptions[NCBI_info['Primers'] == ARTIC_UNKNOWN_VERSION].value_counts()
+	if len(unversioned) > 0:
+		print(CRED + " {} descriptions say ARTIC without a version and were left out, add a rule to {} if their version is known:\n{}".format(len(unversioned), rules_file, unversioned.to_string()) + CEND)
 	NCBI_info_cleaned = NCBI_info[NCBI_info["Primers"].str.contains('Artic protocol V3')]
 	print(NCBI_info)
 	#NCBI_info_cleaned.to_csv('NCBI_Info_Cleaned_Run2.csv', sep=',', index=True)
@@ -122,30 +246,29 @@ def combine(pango, NCBI_info_cleaned):
 	NCBI_info = NCBI_info_cleaned
 	Pango = pd.read_csv(pango, sep='\t', header=0)
 	NCBI_info.rename(columns = {'SRR':'SRR_ID'}, inplace = True) # change column names for merging
-	NCBI_info = NCBI_info.drop(columns=['Unnamed: 0'])
+	NCBI_info = NCBI_info.drop(columns=['Unnamed: 0'], errors='ignore') # only there when the table was read back from csv
 	NCBI_info['SRR_ID'] = NCBI_info['SRR_ID'].str.replace("\n", "")
 	Combined = NCBI_info.merge(Pango, how='inner', on='SRR_ID')  # merge
 	Combined.to_csv('Random_Genomes_With_NCBI_Info.csv', sep=',', index=True)
-
-def double_check(SRR):
-	driver = webdriver.Chrome()  # Alternatively you can change this to driver webdriver.Chrome(executable_path="C:\\chromedriver.exe")
-	driver.get("https://www.ncbi.nlm.nih.gov/sra/")  # get to sra login page
-	driver.find_element_by_id("term").send_keys(SRR) 
-	driver.find_element_by_id('search').click()
-	details = driver.find_element_by_xpath('//*[@id="ResultView"]/div[4]/span').text
-	lines = details.splitlines()
-	for line in lines:
-		if line.startswith("Amplicon based sequencing"):
-			Sample = line.replace("Amplicon based sequencing (ARTIC v3 Primers) of clinical SARS-CoV-2 virus", "Artic protocol V3")
-	print(Sample)
+	return Combined
 
 def main():
 	args = parse_cmdline()
-	NCBI_Info_Larger = NCBI_grab(args.IDs)
-	NCBI_info_cleaned = clean_table(NCBI_Info_Larger)
-	combine(args.pango, NCBI_info_cleaned)
-	#SRR = "SRR13530301"
-	#double_check(SRR)
+	manifest = RunManifest("NCBI_Scraping.py", vars(args), args.manifest, args.profile)
+	manifest.probe_versions(packages=PACKAGES)
+	try:
+		with manifest.stage("NCBI fetch") as stage:
+			NCBI_Info_Larger = NCBI_grab(args.IDs, args.url, args.workers, args.batch_size, args.cache_file, args.ttl_days, args.offline)
+			stage["records"] = len(NCBI_Info_Larger)
+		with manifest.stage("clean") as stage:
+			NCBI_info_cleaned = clean_table(NCBI_Info_Larger, args.primer_rules)
+			stage["records"] = len(NCBI_info_cleaned)
+		with manifest.stage("merge") as stage:
+			stage["records"] = len(combine(args.pango, NCBI_info_cleaned))
+	except BaseException:
+		manifest.write("failed")
+		raise
+	manifest.write()
 
 if __name__ == '__main__':
 	main()
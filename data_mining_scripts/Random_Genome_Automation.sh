@@ -25,8 +25,6 @@
 
 cd /$PWD/Random_Genome_Automation
 ## Getting sequence variants
-module load seqkit/1.0
-module load BBMap/38.90
 module load snippy/4.3.8
 
 #python3 Generate_Random_Fasta.py --random-only -n 50
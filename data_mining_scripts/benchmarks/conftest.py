@@ -0,0 +1,45 @@
+## Fixtures for the benchmarks of Generate_fasta.py and NCBI_Scraping.py, see readme.md for how to run and compare them.
+## The scale is set with BENCH_GENOMES (number of genomes, 20000 by default) and BENCH_SEQ_LEN (genome length, 1000 by default).
+
+import os, sys
+import pytest
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR)) # the scripts are not a package, import them from data_mining_scripts
+sys.path.insert(0, BENCH_DIR)
+
+import synthetic
+
+STUBS = os.path.join(BENCH_DIR, "stubs")
+NUM_GENOMES = int(os.environ.get("BENCH_GENOMES", 20000))
+SEQ_LEN = int(os.environ.get("BENCH_SEQ_LEN", 1000))
+
+@pytest.fixture(scope="session")
+def dataset(tmp_path_factory):
+	'''A synthetic pangolin report, full fasta, mapping file and variant list, made once for all the benchmarks.'''
+	outdir = str(tmp_path_factory.mktemp("dataset"))
+	records = synthetic.write_dataset(outdir, NUM_GENOMES, SEQ_LEN)
+	os.makedirs(os.path.join(outdir, "ref"))
+	with open(os.path.join(outdir, "variants.txt")) as f:
+		variants = [line.rstrip() for line in f]
+	return {"dir": outdir, "records": records, "variants": variants, "report": os.path.join(outdir, "pangolin_report.csv"),
+		"fasta": os.path.join(outdir, "all.fasta"), "mapping": os.path.join(outdir, "mapping.tsv"), "variant_file": os.path.join(outdir, "variants.txt"),
+		"ref": os.path.join(outdir, "ref")}
+
+@pytest.fixture(scope="session")
+def report(dataset):
+	'''The pangolin report reduced to the variants with the lineage and ID columns made the way get_file makes them.'''
+	import Generate_fasta
+	Pango_Output = Generate_fasta.load_table(dataset["report"], ',', Generate_fasta.PANGO_DTYPES, None)
+	Pango_Output_VOCI = Pango_Output[Pango_Output['lineage'].isin(dataset["variants"])].copy()
+	Pango_Output_VOCI['lineage'] = Pango_Output_VOCI['lineage'].cat.set_categories(dataset["variants"])
+	Pango_Output_VOCI['ID'] = Pango_Output_VOCI['taxon'].str.split("|").str[1]
+	return Pango_Output_VOCI
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+	'''Runs the benchmark in its own directory with the snippy stubs first on the PATH, the scripts write their output to the working directory.'''
+	monkeypatch.chdir(tmp_path)
+	monkeypatch.setenv("PATH", STUBS + os.pathsep + os.environ.get("PATH", ""))
+	return tmp_path
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+
+## Synthetic SARS-CoV-2 inputs for the benchmarks of Generate_fasta.py and NCBI_Scraping.py.
+## Everything is made from a seeded random.Random so the same scale always gives the same files.
+## written in python3
+
+import os, random
+import pandas as pd
+from argparse import ArgumentParser
+
+LINEAGES = ["B.1.1.7", "B.1.351", "B.1.427", "B.1.429", "P.1", "B.1.526", "B.1.525", "B.1.526.1", "P.2", "B.1.617.2", "B.1.2", "B.1.1.519"]
+# Countries with a space are written with an underscore by pangolin, so these also exercise header_rules.tsv
+COUNTRIES = ["USA", "England", "Scotland", "Wales", "Northern Ireland", "Denmark", "South Africa", "Brazil", "India", "Hong Kong"]
+BASES = "ACGT"
+CORE_COLUMNS = ["ID", "LENGTH", "ALIGNED", "UNALIGNED", "VARIANT", "HET", "MASKED", "LOWCOV"]
+# Primers/protocol descriptions in the ways they are written in the SRA, see primer_rules.tsv
+PRIMER_DESCRIPTIONS = ["ARTIC v3", "Artic V3 primers", "artic_primer_version 3", "ARTIC nCoV-2019 V4", "ARTIC V4.1", "artic_primer_version 4.1", "ARTIC amplicons",
+	"Midnight 1200bp amplicons", "Nextera XT", "https://www.sanger.ac.uk/covid-team", "", "Unknown", "in house multiplex PCR primers"]
+PROTOCOLS = ["", "artic_protocol_version 3.0", "Illumina COVIDSeq", "Freed et al. 2020"]
+
+def taxa(num_genomes, seed=0, lineages=LINEAGES):
+	'''Makes num_genomes GISAID style fasta headers (hCoV-19/<country>/<lab>-<n>/2021|EPI_ISL_<n>|<date>) with a lineage for each.
+	Lineages are skewed like real reports so a few lineages have most of the genomes.'''
+	rng = random.Random(seed)
+	weights = [1.0 / (rank + 1) for rank in range(len(lineages))]
+	records = []
+	for n in range(num_genomes):
+		country = rng.choice(COUNTRIES)
+		header = "hCoV-19/{}/LAB-{}/2021|EPI_ISL_{}|2021-{:02d}-{:02d}".format(country, n, 400000 + n, rng.randint(1, 12), rng.randint(1, 28))
+		records.append((header, rng.choices(lineages, weights)[0]))
+	return records
+
+def write_pangolin_report(path, records):
+	'''Writes the pangolin report for the records made by taxa, with the spaces in the taxon written as underscores like pangolin does.'''
+	report = pd.DataFrame({"taxon": [header.replace(" ", "_") for header, lineage in records], "lineage": [lineage for header, lineage in records]})
+	report["probability"] = 1.0
+	report["pangoLEARN_version"] = "2021-05-19"
+	report["status"] = "passed_qc"
+	report["note"] = ""
+	report.to_csv(path, index=False)
+	return report
+
+def write_fasta(path, records, seq_len=29903, seed=0, mutations=30, line_width=60):
+	'''Writes a multi-fasta with one record for each header in records. Each sequence is one random genome with a few substitutions,
+	wrapped at line_width like the GISAID download.'''
+	rng = random.Random(seed)
+	genome = [rng.choice(BASES) for _ in range(seq_len)]
+	with open(path, "w") as f:
+		for header, lineage in records:
+			seq = list(genome)
+			for position in rng.sample(range(seq_len), min(mutations, seq_len)):
+				seq[position] = rng.choice(BASES)
+			seq = "".join(seq)
+			f.write(">" + header + "\n")
+			f.write("\n".join(seq[i:i + line_width] for i in range(0, seq_len, line_width)) + "\n")
+
+def core_table(IDs, seq_len=29903, seed=0):
+	'''Makes a snippy-core core.txt table for the samples in IDs.'''
+	rng = random.Random(seed)
+	rows = []
+	for ID in IDs:
+		unaligned = rng.randint(0, 3000)
+		rows.append([ID, seq_len, seq_len - unaligned, unaligned, rng.randint(10, 60), rng.randint(0, 3), 0, rng.randint(0, 40)])
+	return pd.DataFrame(rows, columns=CORE_COLUMNS)
+
+def write_core(path, IDs, seq_len=29903, seed=0):
+	'''Writes core.txt for the samples in IDs the way snippy-core does, tab separated with a header.'''
+	core = core_table(IDs, seq_len, seed)
+	core.to_csv(path, sep="\t", index=False)
+	return core
+
+def SRR_IDs(IDs):
+	'''An SRR accession for each GISAID ID.'''
+	return ["SRR{}".format(10000000 + int(ID.split("_")[-1])) for ID in IDs]
+
+def write_mapping(path, IDs, seed=0, duplicates=0.02):
+	'''Writes the GISAID_ID -> SRR_ID mapping file, with a few repeated SRRs like the real one has.'''
+	rng = random.Random(seed)
+	SRRs = SRR_IDs(IDs)
+	for i in range(1, len(SRRs)):
+		if rng.random() < duplicates:
+			SRRs[i] = SRRs[i - 1]
+	mapping = pd.DataFrame({"GISAID_ID": IDs, "SRR_ID": SRRs, "Collection_date": "2021-03-01"})
+	mapping.to_csv(path, sep="\t", index=False)
+	return mapping
+
+def sra_table(SRRs, seed=0):
+	'''Makes the table NCBI_grab returns, with primers and protocols written in the different ways they are in the SRA.'''
+	rng = random.Random(seed)
+	rows = []
+	for SRR in SRRs:
+		rows.append([SRR, "SAMN{}".format(SRR[3:]), rng.choice(["PAIRED", "SINGLE"]), rng.choice(["Illumina MiSeq", "NextSeq 550", "MinION"]),
+			rng.choice(PRIMER_DESCRIPTIONS), rng.choice(PROTOCOLS)])
+	return pd.DataFrame(rows, columns=["SRR", "BioSample", "Layout", "Instrument", "Primers", "Protocol"])
+
+def write_dataset(outdir, num_genomes, seq_len=29903, seed=0):
+	'''Writes a pangolin report, full fasta, mapping file and variant list into outdir. Returns the records.'''
+	os.makedirs(outdir, exist_ok=True)
+	records = taxa(num_genomes, seed)
+	write_pangolin_report(os.path.join(outdir, "pangolin_report.csv"), records)
+	write_fasta(os.path.join(outdir, "all.fasta"), records, seq_len, seed)
+	IDs = [header.split("|")[1] for header, lineage in records]
+	write_mapping(os.path.join(outdir, "mapping.tsv"), IDs, seed)
+	with open(os.path.join(outdir, "variants.txt"), "w") as f:
+		f.write("\n".join(LINEAGES[:9]) + "\n")
+	return records
+
+def main():
+	parser = ArgumentParser(description="Writes a synthetic pangolin report, GISAID style fasta, mapping file and variant list to run Generate_fasta.py on.")
+	parser.add_argument("-n", "--genomes", dest="genomes", action="store", type=int, default=10000, required=False, help="The number of genomes.")
+	parser.add_argument("-l", "--length", dest="length", action="store", type=int, default=29903, required=False, help="The length of each genome.")
+	parser.add_argument("-s", "--seed", dest="seed", action="store", type=int, default=0, required=False, help="Seed for the random data.")
+	parser.add_argument("-o", "--outdir", dest="outdir", action="store", required=True, help="The directory the files are written to.")
+	args = parser.parse_args()
+	write_dataset(args.outdir, args.genomes, args.length, args.seed)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,68 @@
+## Benchmarks of the fasta subsetting, snippy output merging and stats of Generate_fasta.py on synthetic data.
+
+import os
+import pytest
+import pandas as pd
+
+pytest.importorskip("pytest_benchmark")
+
+import Generate_fasta
+import synthetic
+from run_manifest import RunManifest
+
+SEQ_NUM = 30
+SEED = 1
+
+@pytest.fixture(scope="module")
+def taxon_lineage(report):
+	header_rules = Generate_fasta.load_header_rules(Generate_fasta.HEADER_RULES)
+	taxon_keys = Generate_fasta.normalize_taxa(report['taxon'], header_rules)
+	return header_rules, dict(zip(taxon_keys, report['lineage']))
+
+@pytest.fixture(scope="module")
+def merged(report):
+	'''What get_file returns after snippy: the report merged with a core.txt for every genome.'''
+	core = synthetic.core_table(report['ID'].tolist(), seed=SEED)
+	return report.merge(core, how='inner', on='ID')
+
+def test_sample_fasta(benchmark, dataset, workdir, taxon_lineage):
+	header_rules, lookup = taxon_lineage
+	seq_counts, matched = benchmark(Generate_fasta.sample_fasta, dataset["fasta"], lookup, dataset["variants"], SEQ_NUM, SEED, header_rules)
+	assert len(matched) == len(lookup)
+
+def test_demultiplex_fasta(benchmark, dataset, workdir, taxon_lineage):
+	header_rules, lookup = taxon_lineage
+	seq_counts, matched = benchmark(Generate_fasta.demultiplex_fasta, dataset["fasta"], lookup, dataset["variants"], header_rules)
+	assert sum(seq_counts.values()) == len(lookup)
+
+def test_build_fasta_index(benchmark, dataset):
+	index = benchmark(Generate_fasta.build_fasta_index, dataset["fasta"])
+	assert len(index["ids"]) == len(dataset["records"])
+
+def test_subset_indexed_fasta(benchmark, dataset, workdir, report):
+	index = Generate_fasta.load_fasta_index(dataset["fasta"])
+	seq_counts, matched = benchmark(Generate_fasta.subset_indexed_fasta, dataset["fasta"], index, report, dataset["variants"], False, SEQ_NUM, SEED)
+	assert len(matched) == len(report)
+
+def test_get_file(benchmark, dataset, workdir):
+	'''The whole of get_file with -n 30, snippy and snippy-core are the stubs so this is the time spent in python.'''
+	args = Generate_fasta.parse_cmdline(["-p", dataset["report"], "-f", dataset["fasta"], "-v", dataset["variant_file"], "-ref", dataset["ref"], "-m", dataset["mapping"],
+		"-n", str(SEQ_NUM), "-s", str(SEED), "-t", "4", "-c", "1", "--no-cache", "--manifest", str(workdir / "manifest.json")])
+	manifest = RunManifest("Generate_fasta.py", vars(args), args.manifest)
+	df_SRR = Generate_fasta.load_mapping(args.mapping_file, args.cache_dir)
+	df_merge = benchmark.pedantic(Generate_fasta.get_file, args=(args, manifest, df_SRR), rounds=3, iterations=1)
+	assert len(df_merge) > 0
+
+def test_combine_output(benchmark, dataset, workdir, report):
+	variant = dataset["variants"][0]
+	Variant_df = report[report['lineage'] == variant]
+	os.makedirs(variant)
+	synthetic.write_core(os.path.join(variant, "core.txt"), Variant_df['ID'].tolist(), seed=SEED)
+	Combined = benchmark(Generate_fasta.combine_output, variant, Variant_df)
+	assert len(Combined) == len(Variant_df)
+
+def test_ID_check_cal_stats(benchmark, dataset, workdir, merged):
+	def ID_check_cal_stats():
+		return Generate_fasta.cal_stats(Generate_fasta.ID_check(Generate_fasta.load_mapping(dataset["mapping"], None), merged))
+	stats = benchmark(ID_check_cal_stats)
+	assert set(stats['lineage']) <= set(dataset["variants"])
@@ -0,0 +1,15 @@
+## Benchmarks of naming the primer schemes in NCBI_Scraping.py on a synthetic SRA table.
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+import NCBI_Scraping
+import synthetic
+
+def test_clean_table(benchmark, dataset):
+	table = synthetic.sra_table(synthetic.SRR_IDs([header.split("|")[1] for header, lineage in dataset["records"]]))
+	# clean_table changes the table it is given so each round gets its own copy
+	cleaned = benchmark.pedantic(NCBI_Scraping.clean_table, setup=lambda: ((table.copy(), NCBI_Scraping.PRIMER_RULES), {}), rounds=5)
+	assert (cleaned['Primers'] == 'Artic protocol V3').all()
+	assert (cleaned['Primer_rule'] != 'artic_no_version').all() # ARTIC amplicons has no version so it is not V3
@@ -0,0 +1,50 @@
+## How the merge of the snippy output with the pangolin report in get_file grows with the size of the report.
+## The row counts are set with BENCH_SCALING_ROWS (comma separated, 125000,250000,500000,1000000 by default).
+## Run only these with: python3 -m pytest data_mining_scripts/benchmarks/test_bench_scaling.py
+
+import os
+import pytest
+import pandas as pd
+
+pytest.importorskip("pytest_benchmark")
+
+import Generate_fasta
+import synthetic
+
+ROWS = [int(rows) for rows in os.environ.get("BENCH_SCALING_ROWS", "125000,250000,500000,1000000").split(",")]
+LINEAR_TOLERANCE = 3 # quadratic growth would be 8 times slower per row from 125k to 1M rows
+
+seconds_per_row = {}
+
+def combine_report(pangolin_input, VOC_VOI_list):
+	'''The steps of get_file from reading the report to the one concat of the per lineage frames, with the core.txt of each lineage already written.'''
+	Pango_Output = Generate_fasta.load_table(pangolin_input, ',', Generate_fasta.PANGO_DTYPES, None)
+	Pango_Output_VOCI = Pango_Output[Pango_Output['lineage'].isin(VOC_VOI_list)].copy()
+	Pango_Output_VOCI['lineage'] = Pango_Output_VOCI['lineage'].cat.set_categories(VOC_VOI_list)
+	Pango_Output_VOCI['ID'] = Pango_Output_VOCI['taxon'].str.split("|").str[1]
+	lineage_groups = dict(list(Pango_Output_VOCI.groupby('lineage', observed=True)))
+	frames = [Generate_fasta.combine_output(variant, lineage_groups[variant]) for variant in VOC_VOI_list if variant in lineage_groups]
+	return pd.concat(frames, ignore_index=True)
+
+@pytest.mark.parametrize("rows", ROWS)
+def test_combine_scaling(benchmark, tmp_path, monkeypatch, rows):
+	monkeypatch.chdir(tmp_path)
+	records = synthetic.taxa(rows)
+	report = synthetic.write_pangolin_report("pangolin_report.csv", records)
+	report['ID'] = report['taxon'].str.split("|").str[1]
+	for variant, IDs in report.groupby('lineage')['ID']:
+		os.makedirs(variant)
+		synthetic.write_core(os.path.join(variant, "core.txt"), IDs.tolist())
+	benchmark.group = "combine scaling"
+	benchmark.extra_info["rows"] = rows
+	df_merge = benchmark.pedantic(combine_report, args=("pangolin_report.csv", synthetic.LINEAGES), rounds=3, iterations=1)
+	assert len(df_merge) == rows
+	if benchmark.stats is not None: # not timed with --benchmark-disable
+		seconds_per_row[rows] = benchmark.stats.stats.min / rows
+
+def test_combine_scales_linearly():
+	'''Run after the row counts above: the time per row of the largest report must stay close to that of the smallest.'''
+	if len(seconds_per_row) < 2:
+		pytest.skip("needs at least two row counts from test_combine_scaling")
+	smallest, largest = min(seconds_per_row), max(seconds_per_row)
+	assert seconds_per_row[largest] < LINEAR_TOLERANCE * seconds_per_row[smallest], seconds_per_row
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+## Timing and resource use of each stage of Generate_fasta.py and NCBI_Scraping.py, written to a json run manifest.
+## written in python3
+
+import os, sys, time, json, socket, resource, subprocess, cProfile
+from contextlib import contextmanager
+from importlib.metadata import version, PackageNotFoundError
+
+# ru_maxrss is in kilobytes on linux and in bytes on macOS
+RSS_UNIT = 1 if sys.platform == "darwin" else 1024
+BLOCK_SIZE = 512 # ru_inblock/ru_oublock count 512 byte blocks
+
+def probe_tool(cmd):
+	'''Runs a tool with its version flag and returns the first line it prints, or None if the tool can not be run or fails.'''
+	try:
+		result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True, timeout=60)
+	except (OSError, subprocess.SubprocessError):
+		return None
+	if result.returncode != 0:
+		return None
+	lines = result.stdout.strip().splitlines()
+	return lines[0].strip() if len(lines) > 0 else None
+
+def probe_package(package):
+	'''Returns the installed version of a python package, or None if it is not installed.'''
+	try:
+		return version(package)
+	except PackageNotFoundError:
+		return None
+
+def read_io():
+	'''Bytes read and written by this process so far from /proc/self/io, or None where there is no /proc (e.g. macOS).'''
+	try:
+		with open("/proc/self/io") as f:
+			io = dict(line.split(":") for line in f if ":" in line)
+	except OSError:
+		return None
+	return int(io["rchar"]), int(io["wchar"])
+
+def reset_peak_rss():
+	"""Resets the peak RSS of this process to its current RSS so the peak of one stage can be read (linux 4.0+). Returns False where that is not possible."""
+	try:
+		with open("/proc/self/clear_refs", "w") as f:
+			f.write("5")
+	except OSError:
+		return False
+	return True
+
+def read_peak_rss():
+	"""The peak RSS of this process in bytes since it started or since reset_peak_rss, from VmHWM in /proc/self/status, or None where there is no /proc."""
+	try:
+		with open("/proc/self/status") as f:
+			for line in f:
+				if line.startswith("VmHWM:"):
+					return int(line.split()[1]) * 1024
+	except OSError:
+		pass
+	return None
+
+def snapshot():
+	'''The clocks and counters compared at the start and end of each stage.'''
+	self_usage = resource.getrusage(resource.RUSAGE_SELF)
+	children = resource.getrusage(resource.RUSAGE_CHILDREN)
+	return {"wall": time.perf_counter(), "cpu": self_usage.ru_utime + self_usage.ru_stime, "children_cpu": children.ru_utime + children.ru_stime,
+		"peak_rss": read_peak_rss(), "max_rss": self_usage.ru_maxrss * RSS_UNIT, "largest_child_rss": children.ru_maxrss * RSS_UNIT, "io": read_io(),
+		"children_blocks": (children.ru_inblock, children.ru_oublock)}
+
+class RunManifest:
+	'''Collects the stages of one run and writes them to a json file along with the arguments and tool versions.
+	peak_rss_bytes of a stage is the peak of the script during that stage only (None where it can not be reset, e.g. macOS).
+	process_peak_rss_bytes and largest_child_rss_bytes are high water marks since the run started, of the script and of its largest child process (snippy, snippy-core).'''
+	def __init__(self, script, args, manifest_file, profile_file=None):
+		self.manifest_file = manifest_file
+		self.profile_file = profile_file
+		self.stages = []
+		self.start = snapshot()
+		self.process_peak_rss = self.start["max_rss"] # resetting the peak for each stage also resets ru_maxrss so the run peak is kept here
+		self.manifest = {"script": script, "args": args, "host": socket.gethostname(), "pid": os.getpid(),
+			"started": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "versions": {"python": sys.version.split()[0]}, "stages": self.stages}
+		self.profiler = cProfile.Profile() if profile_file is not None else None
+		if self.profiler is not None:
+			self.profiler.enable()
+
+	def probe_versions(self, tools=None, packages=None):
+		'''Records the version printed by each tool, e.g. {"snippy": ["snippy", "--version"]}, and of each python package.'''
+		for name, cmd in (tools or {}).items():
+			self.manifest["versions"][name] = probe_tool(cmd)
+		for package in packages or []:
+			self.manifest["versions"][package] = probe_package(package)
+		return self.manifest["versions"]
+
+	@contextmanager
+	def stage(self, name):
+		'''Times the code in the with block as one stage. Set stage["records"] inside the block to record how many records it handled.'''
+		stage = {"stage": name, "records": None}
+		self.process_peak_rss = max(self.process_peak_rss, read_peak_rss() or 0) # the peak so far, before it is reset
+		reset = reset_peak_rss()
+		before = snapshot()
+		try:
+			yield stage
+		finally:
+			after = snapshot()
+			stage.update(measure(before, after, self.track_peak(after)))
+			if not reset:
+				stage["peak_rss_bytes"] = None
+			self.stages.append(stage)
+
+	def track_peak(self, after):
+		'''Adds a snapshot to the peak RSS of the whole run and returns it.'''
+		self.process_peak_rss = max(self.process_peak_rss, after["peak_rss"] or 0, after["max_rss"])
+		return self.process_peak_rss
+
+	def write(self, status="finished"):
+		'''Writes the manifest, and the cProfile stats if asked for. Called at the end of a run or when it fails so the stages done so far are kept.'''
+		if self.profiler is not None:
+			self.profiler.disable()
+			self.profiler.dump_stats(self.profile_file)
+			self.manifest["profile"] = self.profile_file
+		self.manifest["status"] = status
+		self.manifest["finished"] = time.strftime("%Y-%m-%dT%H:%M:%S%z")
+		after = snapshot()
+		self.manifest["total"] = measure(self.start, after, self.track_peak(after))
+		self.manifest["total"]["peak_rss_bytes"] = self.process_peak_rss
+		with open(self.manifest_file, "w") as f:
+			json.dump(self.manifest, f, indent=2)
+
+def measure(before, after, process_peak_rss):
+	'''The difference between two snapshots.'''
+	result = {"wall_seconds": round(after["wall"] - before["wall"], 3), "cpu_seconds": round(after["cpu"] - before["cpu"], 3),
+		"children_cpu_seconds": round(after["children_cpu"] - before["children_cpu"], 3),
+		"peak_rss_bytes": after["peak_rss"], "process_peak_rss_bytes": process_peak_rss, "largest_child_rss_bytes": after["largest_child_rss"],
+		"bytes_read": None, "bytes_written": None,
+		"children_bytes_read": (after["children_blocks"][0] - before["children_blocks"][0]) * BLOCK_SIZE,
+		"children_bytes_written": (after["children_blocks"][1] - before["children_blocks"][1]) * BLOCK_SIZE}
+	if before["io"] is not None and after["io"] is not None:
+		result["bytes_read"] = after["io"][0] - before["io"][0]
+		result["bytes_written"] = after["io"][1] - before["io"][1]
+	return result
@@ -0,0 +1,61 @@
+## Tests of the data mining scripts, run with python3 -m pytest data_mining_scripts/tests
+
+import os, sys, asyncio, threading
+import pytest
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # the scripts are not a package, import them from data_mining_scripts
+
+class MockEFetch:
+	'''A local stand-in for EFetch. It answers each POST with the packages of the SRRs asked for.
+	Batches with an SRR in fail get an HTTP 500, and the next flaky requests get an HTTP 503 whatever they ask for.
+	Every batch asked for is kept in requests.'''
+	def __init__(self):
+		self.packages = {}
+		self.fail = set()
+		self.flaky = 0
+		self.requests = []
+
+	async def handle(self, request):
+		data = await request.post()
+		SRRs = data["id"].split(",")
+		self.requests.append(SRRs)
+		if self.flaky > 0:
+			self.flaky = self.flaky - 1
+			return web.Response(status=503)
+		if len(self.fail.intersection(SRRs)) > 0:
+			return web.Response(status=500)
+		body = "<EXPERIMENT_PACKAGE_SET>" + "".join(self.packages[SRR] for SRR in SRRs if SRR in self.packages) + "</EXPERIMENT_PACKAGE_SET>"
+		return web.Response(text=body, content_type="text/xml")
+
+@pytest.fixture
+def write_ids(tmp_path):
+	'''Writes a list of SRRs to an SRR_IDs.txt file like the one NCBI_Scraping.py is given with -f and returns its path.'''
+	def write(SRRs):
+		IDs = tmp_path / "SRR_IDs.txt"
+		IDs.write_text("\n".join(SRRs) + "\n")
+		return str(IDs)
+	return write
+
+@pytest.fixture
+def efetch(monkeypatch):
+	'''Runs a MockEFetch in its own thread and event loop, the url to pass to NCBI_grab is in efetch.url. Retries do not wait.'''
+	import NCBI_Scraping
+	monkeypatch.setattr(NCBI_Scraping, "RETRY_BACKOFF", 0)
+	monkeypatch.setenv("NCBI_API_KEY", "test") # 10 requests a second instead of 3
+	mock = MockEFetch()
+	app = web.Application()
+	app.router.add_post("/efetch", mock.handle)
+	loop = asyncio.new_event_loop()
+	runner = web.AppRunner(app)
+	loop.run_until_complete(runner.setup())
+	site = web.TCPSite(runner, "127.0.0.1", 0)
+	loop.run_until_complete(site.start())
+	mock.url = "http://127.0.0.1:{}/efetch".format(runner.addresses[0][1])
+	thread = threading.Thread(target=loop.run_forever, daemon=True)
+	thread.start()
+	yield mock
+	loop.call_soon_threadsafe(loop.stop)
+	thread.join()
+	loop.run_until_complete(runner.cleanup())
+	loop.close()
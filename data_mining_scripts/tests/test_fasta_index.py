@@ -0,0 +1,44 @@
+## The GISAID ID index of the full fasta used by Generate_fasta.py --fasta-index.
+
+import os
+import pytest
+
+import Generate_fasta
+
+FASTA = ">hCoV-19/USA/A-1/2021|EPI_ISL_1|2021-01-01\nACGT\nACGT\n>hCoV-19/USA/A-2/2021|EPI_ISL_2|2021-01-02\nGGGG\n"
+
+@pytest.fixture
+def fasta(tmp_path, monkeypatch):
+	os.makedirs(tmp_path / "shared")
+	os.makedirs(tmp_path / "run")
+	monkeypatch.chdir(tmp_path / "run")
+	path = tmp_path / "shared" / "all.fasta"
+	path.write_text(FASTA)
+	return str(path)
+
+def test_truncated_index_is_made_again(fasta):
+	index = Generate_fasta.load_fasta_index(fasta)
+	with open(Generate_fasta.fasta_index_name(fasta), "r+b") as f: # what a job killed while writing used to leave behind
+		f.truncate(100)
+	again = Generate_fasta.load_fasta_index(fasta)
+	assert again["ids"].tolist() == index["ids"].tolist() == [b"EPI_ISL_1", b"EPI_ISL_2"]
+	assert Generate_fasta.read_fasta_index(fasta, Generate_fasta.fasta_index_name(fasta)) is not None
+	assert not os.path.exists(Generate_fasta.fasta_index_name(fasta) + ".tmp")
+
+def test_read_only_fasta_dir_uses_working_directory(fasta, monkeypatch):
+	replace = os.replace
+	def read_only(src, dst):
+		if os.path.dirname(dst) == os.path.dirname(fasta):
+			raise PermissionError(13, "Permission denied", dst)
+		return replace(src, dst)
+	monkeypatch.setattr(os, "replace", read_only)
+	index = Generate_fasta.load_fasta_index(fasta)
+	assert not os.path.exists(Generate_fasta.fasta_index_name(fasta))
+	assert os.path.exists(Generate_fasta.fasta_index_name(fasta, os.getcwd()))
+	assert os.listdir(os.path.dirname(fasta)) == ["all.fasta"] # no temporary file left next to the fasta
+	assert Generate_fasta.lookup_fasta_index(index, [b"EPI_ISL_2"]).tolist() == [1]
+
+def test_index_dir(fasta, tmp_path):
+	Generate_fasta.load_fasta_index(fasta, str(tmp_path / "indexes"))
+	assert os.listdir(tmp_path / "indexes") == ["all.fasta.gidx.npz"]
+	assert not os.path.exists(Generate_fasta.fasta_index_name(fasta))
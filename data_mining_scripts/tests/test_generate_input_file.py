@@ -0,0 +1,60 @@
+## generate_input_file in Generate_fasta.py with loose sample files and with --indexed-samples.
+
+import os
+import pytest
+
+import Generate_fasta
+
+VARIANT = "B.1.1.7"
+RECORDS = [
+	("hCoV-19/USA/A-1/2021|EPI_ISL_1|2021-01-01", "ACGTACGTAC\nGTAC\n"),
+	("hCoV-19/USA/A-2/2021|EPI_ISL_2|2021-01-02", "TTTT\n"),
+	("hCoV-19/USA/A-3/2021", "GGGG\n"), # no GISAID ID
+	("hCoV-19/USA/A-4/2021||2021-01-04", "CCCC\n"), # empty GISAID ID
+	("hCoV-19/USA/A-1b/2021|EPI_ISL_1|2021-01-05", "AAAA\n"), # repeated GISAID ID
+	("hCoV-19/USA/A-5/2021|EPI_ISL_5|2021-01-06", "ACGTNNNNNNNNNNACGT\nACGT\nAC\n"),
+]
+KEPT = {"EPI_ISL_1": "ACGTACGTACGTAC", "EPI_ISL_2": "TTTT", "EPI_ISL_5": "ACGTNNNNNNNNNNACGTACGTAC"}
+
+@pytest.fixture
+def variant_fasta(tmp_path, monkeypatch):
+	monkeypatch.chdir(tmp_path)
+	with open(VARIANT + ".fasta", "w") as f:
+		for header, seq in RECORDS:
+			f.write(">" + header + "\n" + seq)
+	return VARIANT + ".fasta"
+
+def read_tab(variant):
+	with open(os.path.join(variant, variant + ".tab")) as f:
+		return [line.rstrip("\n").split("\t") for line in f]
+
+def test_loose_samples(variant_fasta, capsys):
+	Generate_fasta.generate_input_file(VARIANT, variant_fasta)
+	tab = read_tab(VARIANT)
+	assert [sample for sample, path in tab] == list(KEPT)
+	for sample, path in tab:
+		assert path == os.path.abspath(os.path.join(VARIANT, sample + ".fasta"))
+		[(header, seq)] = Generate_fasta.read_fasta(path)
+		assert header.split("|")[1] == sample
+		assert seq == KEPT[sample]
+	assert "3 sequences in {} had no GISAID ID or a repeated one".format(variant_fasta) in capsys.readouterr().out
+
+def test_indexed_samples_match_loose_samples(variant_fasta):
+	Generate_fasta.generate_input_file(VARIANT, variant_fasta, indexed=True)
+	tab = read_tab(VARIANT)
+	assert [sample for sample, path in tab] == list(KEPT)
+	assert not any(os.path.exists(path) for sample, path in tab) # sample files are only written while snippy runs
+	samples_fasta = Generate_fasta.samples_fasta_name(VARIANT)
+	index = Generate_fasta.read_fai(samples_fasta + ".fai")
+	assert list(index) == list(KEPT)
+	with open(samples_fasta, "rb") as f:
+		data = f.read()
+	for sample, path in tab:
+		offset, length = index[sample]
+		assert data[offset:offset + length].decode() == KEPT[sample] # the offsets point at the sequence
+		Generate_fasta.write_indexed_sample(samples_fasta, offset, length, sample, path)
+		[(header, seq)] = Generate_fasta.read_fasta(path)
+		assert header == sample
+		assert seq == KEPT[sample]
+	# the samples fasta is a valid fasta with the GISAID ID as the name, so samtools faidx gives the same index
+	assert [(header.split(" ")[0], seq) for header, seq in Generate_fasta.read_fasta(samples_fasta)] == list(KEPT.items())
@@ -0,0 +1,19 @@
+## The header rules that match the fasta headers of Generate_fasta.py to the pangolin taxon column.
+
+import pandas as pd
+
+import Generate_fasta
+
+def test_rules_without_trailing_tab(tmp_path):
+	rules_file = tmp_path / "header_rules.tsv"
+	with open(Generate_fasta.HEADER_RULES) as f:
+		rules_file.write_text("".join(line.rstrip() + "\n" for line in f)) # what a whitespace hook leaves of the file
+	rules = Generate_fasta.load_header_rules(str(rules_file))
+	assert [(rule, replacement) for rule, pattern, replacement in rules] == [(rule, replacement) for rule, pattern, replacement in Generate_fasta.load_header_rules(Generate_fasta.HEADER_RULES)]
+	assert Generate_fasta.normalize_header(" hCoV-19/Northern Ireland/X-1/2021|EPI_ISL_1|2021-01-01 ", rules) == "hCoV-19/Northern_Ireland/X-1/2021|EPI_ISL_1|2021-01-01"
+
+def test_taxa_and_headers_normalize_the_same():
+	rules = Generate_fasta.load_header_rules(Generate_fasta.HEADER_RULES)
+	headers = ["hCoV-19/Hong Kong/X-1/2021|EPI_ISL_1|2021-01-01", "hCoV-19/South  Africa/X-2/2021|EPI_ISL_2|2021-01-01"]
+	taxa = pd.Series(["hCoV-19/Hong_Kong/X-1/2021|EPI_ISL_1|2021-01-01", "hCoV-19/South_Africa/X-2/2021|EPI_ISL_2|2021-01-01"])
+	assert Generate_fasta.normalize_taxa(taxa, rules).tolist() == [Generate_fasta.normalize_header(header, rules) for header in headers]
@@ -0,0 +1,30 @@
+## --live-stats in Generate_fasta.py against the stats written at the end of the run, with the snippy stubs from benchmarks/stubs.
+
+import os, sys
+import pandas as pd
+
+import Generate_fasta
+from run_manifest import RunManifest
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks")
+sys.path.insert(0, BENCH_DIR)
+
+import synthetic
+
+def test_live_stats_match_final_stats(tmp_path, monkeypatch):
+	monkeypatch.chdir(tmp_path)
+	monkeypatch.setenv("PATH", os.path.join(BENCH_DIR, "stubs") + os.pathsep + os.environ.get("PATH", ""))
+	records = synthetic.write_dataset("data", 400, seq_len=100)
+	IDs = [header.split("|")[1] for header, lineage in records]
+	synthetic.write_mapping(os.path.join("data", "mapping.tsv"), IDs[::2], duplicates=0.2) # half the genomes have an SRR, some SRRs twice
+	os.makedirs("ref")
+	args = Generate_fasta.parse_cmdline(["--all", "-l", "-p", "data/pangolin_report.csv", "-f", "data/all.fasta", "-v", "data/variants.txt", "-ref", "ref",
+		"-m", "data/mapping.tsv", "-t", "4", "-c", "1", "--no-cache", "--manifest", "manifest.json"])
+	manifest = RunManifest("Generate_fasta.py", vars(args), args.manifest)
+	df_SRR = Generate_fasta.load_mapping(args.mapping_file, args.cache_dir)
+	df_merge = Generate_fasta.get_file(args, manifest, df_SRR)
+	live = pd.read_csv(Generate_fasta.LINEAGE_STATS_FILE, sep='\t')
+	Generate_fasta.Check_and_add_stats(df_SRR, df_merge)
+	final = pd.read_csv(Generate_fasta.LINEAGE_STATS_FILE, sep='\t')
+	assert live['VARIANT_count'].sum() < df_merge['ID'].nunique() # the genomes without an SRR are not counted
+	pd.testing.assert_frame_equal(live.sort_values('lineage').reset_index(drop=True), final.sort_values('lineage').reset_index(drop=True))
@@ -0,0 +1,77 @@
+## The parquet cache of load_table in Generate_fasta.py.
+
+import os, glob, json
+import pytest
+import pandas as pd
+
+import Generate_fasta
+
+pytest.importorskip("pyarrow")
+
+DTYPES = {"taxon": "string", "lineage": "category"}
+
+@pytest.fixture
+def report(tmp_path, monkeypatch):
+	monkeypatch.chdir(tmp_path)
+	with open("report.csv", "w") as f:
+		f.write("taxon,lineage,probability\nhCoV-19/USA/A-1/2021|EPI_ISL_1|2021-01-01,B.1.1.7,1.0\nhCoV-19/USA/A-2/2021|EPI_ISL_2|2021-01-02,P.1,1.0\n")
+	return "report.csv"
+
+@pytest.fixture
+def parsed(monkeypatch):
+	'''Counts the times a table is parsed from the csv instead of read from the cache.'''
+	calls = []
+	read_csv = pd.read_csv
+	def counting_read_csv(*args, **kwargs):
+		calls.append(args[0])
+		return read_csv(*args, **kwargs)
+	monkeypatch.setattr(pd, "read_csv", counting_read_csv)
+	return calls
+
+def cache_files(suffix):
+	return glob.glob(os.path.join("cache", "*" + suffix))
+
+def test_cache_hit(report, parsed):
+	first = Generate_fasta.load_table(report, ',', DTYPES, "cache")
+	second = Generate_fasta.load_table(report, ',', DTYPES, "cache")
+	assert len(parsed) == 1
+	pd.testing.assert_frame_equal(first, second)
+	assert list(second.columns) == ["taxon", "lineage"]
+	assert len(cache_files(".tmp")) == 0
+
+def test_changed_file_is_parsed_again(report, parsed):
+	Generate_fasta.load_table(report, ',', DTYPES, "cache")
+	with open(report, "a") as f:
+		f.write("hCoV-19/USA/A-3/2021|EPI_ISL_3|2021-01-03,B.1.351,1.0\n")
+	table = Generate_fasta.load_table(report, ',', DTYPES, "cache")
+	assert len(parsed) == 2
+	assert len(table) == 3
+
+def test_same_contents_with_a_new_mtime_uses_the_cache(report, parsed):
+	Generate_fasta.load_table(report, ',', DTYPES, "cache")
+	os.utime(report, ns=(1, 1))
+	table = Generate_fasta.load_table(report, ',', DTYPES, "cache")
+	assert len(parsed) == 1
+	assert len(table) == 2
+	with open(cache_files(".json")[0]) as f:
+		assert json.load(f)["mtime_ns"] == 1
+
+def test_truncated_parquet_is_parsed_again(report, parsed):
+	Generate_fasta.load_table(report, ',', DTYPES, "cache")
+	parquet = cache_files(".parquet")[0]
+	with open(parquet, "r+b") as f:
+		f.truncate(os.path.getsize(parquet) // 2)
+	table = Generate_fasta.load_table(report, ',', DTYPES, "cache")
+	assert len(parsed) == 2
+	assert len(table) == 2
+	assert len(pd.read_parquet(parquet)) == 2 # the cache was written again
+
+def test_without_pyarrow(report, parsed, monkeypatch):
+	def no_pyarrow(*args, **kwargs):
+		raise ImportError("Unable to find a usable engine")
+	monkeypatch.setattr(pd.DataFrame, "to_parquet", no_pyarrow)
+	for n in range(2):
+		table = Generate_fasta.load_table(report, ',', DTYPES, "cache")
+		assert len(table) == 2
+	assert len(parsed) == 2
+	assert os.listdir("cache") == []
@@ -0,0 +1,28 @@
+## The sqlite cache of NCBI_Scraping.py keeps every batch that was fetched, even when another batch fails.
+
+import pytest
+
+import NCBI_Scraping
+
+PACKAGE = """<EXPERIMENT_PACKAGE><EXPERIMENT><DESIGN><LIBRARY_DESCRIPTOR><LIBRARY_LAYOUT><PAIRED/></LIBRARY_LAYOUT>
+<LIBRARY_CONSTRUCTION_PROTOCOL>ARTIC V3</LIBRARY_CONSTRUCTION_PROTOCOL></LIBRARY_DESCRIPTOR></DESIGN>
+<PLATFORM><ILLUMINA><INSTRUMENT_MODEL>Illumina MiSeq</INSTRUMENT_MODEL></ILLUMINA></PLATFORM></EXPERIMENT>
+<SAMPLE><IDENTIFIERS><EXTERNAL_ID namespace="BioSample">SAMN{n}</EXTERNAL_ID></IDENTIFIERS></SAMPLE>
+<RUN_SET><RUN accession="SRR{n}"/></RUN_SET></EXPERIMENT_PACKAGE>"""
+
+def test_failed_batch_keeps_the_others(efetch, tmp_path, write_ids):
+	SRRs = ["SRR{}".format(n) for n in range(1, 6)]
+	efetch.packages = {"SRR{}".format(n): PACKAGE.format(n=n) for n in range(1, 6)}
+	efetch.fail = {"SRR2"}
+	cache_file = str(tmp_path / "sra_cache.sqlite")
+	with pytest.raises(RuntimeError):
+		NCBI_Scraping.NCBI_grab(write_ids(SRRs), efetch.url, workers=1, batch_size=1, cache_file=cache_file)
+	conn = NCBI_Scraping.open_cache(cache_file)
+	assert sorted(NCBI_Scraping.read_cache(conn, SRRs)) == ["SRR1", "SRR3", "SRR4", "SRR5"]
+	conn.close()
+	# the next run only asks for the batch that failed
+	efetch.fail = set()
+	efetch.requests = []
+	df = NCBI_Scraping.NCBI_grab(write_ids(SRRs), efetch.url, workers=1, batch_size=1, cache_file=cache_file)
+	assert efetch.requests == [["SRR2"]]
+	assert df['SRR'].tolist() == SRRs
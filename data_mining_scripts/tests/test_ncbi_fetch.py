@@ -0,0 +1,59 @@
+## NCBI_Scraping.py against a local mock EFetch serving a canned EXPERIMENT_PACKAGE_SET.
+
+import os, sys, subprocess
+import pandas as pd
+
+import NCBI_Scraping
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "NCBI_Scraping.py")
+
+def package(runs, BioSample, layout="PAIRED", instrument="Illumina MiSeq", protocol="", design="", attributes=None):
+	attributes = "".join("<SAMPLE_ATTRIBUTE><TAG>{}</TAG><VALUE>{}</VALUE></SAMPLE_ATTRIBUTE>".format(tag, value) for tag, value in (attributes or {}).items())
+	return """<EXPERIMENT_PACKAGE><EXPERIMENT><DESIGN><DESIGN_DESCRIPTION>{design}</DESIGN_DESCRIPTION>
+<LIBRARY_DESCRIPTOR><LIBRARY_LAYOUT><{layout}/></LIBRARY_LAYOUT><LIBRARY_CONSTRUCTION_PROTOCOL>{protocol}</LIBRARY_CONSTRUCTION_PROTOCOL></LIBRARY_DESCRIPTOR></DESIGN>
+<PLATFORM><ILLUMINA><INSTRUMENT_MODEL>{instrument}</INSTRUMENT_MODEL></ILLUMINA></PLATFORM></EXPERIMENT>
+<SAMPLE><IDENTIFIERS><EXTERNAL_ID namespace="BioSample">{BioSample}</EXTERNAL_ID></IDENTIFIERS><SAMPLE_ATTRIBUTES>{attributes}</SAMPLE_ATTRIBUTES></SAMPLE>
+<RUN_SET>{runs}</RUN_SET></EXPERIMENT_PACKAGE>""".format(design=design, layout=layout, protocol=protocol, instrument=instrument, BioSample=BioSample,
+		attributes=attributes, runs="".join('<RUN accession="{}"/>'.format(run) for run in runs))
+
+PACKAGES = {
+	"SRR1": package(["SRR1"], "SAMN1", protocol="ARTIC V3 PCR-tiling of viral cDNA"),
+	# the library kit does not say which primers, so they come from the sample attributes
+	"SRR2": package(["SRR2"], "SAMN2", layout="SINGLE", instrument="NextSeq 550", protocol="Nextera XT",
+		attributes={"artic_primer_version": "3", "artic_protocol_version": "3.0"}),
+	# no library protocol and no attributes, the design description is used
+	"SRR3": package(["SRR3"], "SAMN3", design="ARTIC v4 amplicons"),
+	"SRR4": package(["SRR4"], "SAMN4", protocol="ILLUMINA_DNA_PREP| Artic_V3"),
+	# an experiment with a run that was not asked for
+	"SRR5": package(["SRR5", "SRR99"], "SAMN5", protocol=""),
+}
+
+EXPECTED = pd.DataFrame([
+	["SRR1", "SAMN1", "PAIRED", "Illumina MiSeq", "ARTIC V3 PCR-tiling of viral cDNA", "Unknown"],
+	["SRR2", "SAMN2", "SINGLE", "NextSeq 550", "artic_primer_version 3", "artic_protocol_version 3.0"],
+	["SRR3", "SAMN3", "PAIRED", "Illumina MiSeq", "ARTIC v4 amplicons", "Unknown"],
+	["SRR4", "SAMN4", "PAIRED", "Illumina MiSeq", "Artic_V3", "Unknown"],
+	["SRR5", "SAMN5", "PAIRED", "Illumina MiSeq", "Unknown", "Unknown"],
+], columns=NCBI_Scraping.SRA_COLUMNS)
+
+def test_parse_sra_xml():
+	rows = NCBI_Scraping.parse_sra_xml("<EXPERIMENT_PACKAGE_SET>" + "".join(PACKAGES.values()) + "</EXPERIMENT_PACKAGE_SET>")
+	assert [row['SRR'] for row in rows] == ["SRR1", "SRR2", "SRR3", "SRR4", "SRR5", "SRR99"]
+
+def test_fetch_in_batches_with_retry(efetch, tmp_path, write_ids):
+	efetch.packages = PACKAGES
+	efetch.flaky = 1 # the first request fails and is retried
+	df = NCBI_Scraping.NCBI_grab(write_ids(list(PACKAGES)), efetch.url, workers=2, batch_size=2, cache_file=str(tmp_path / "sra_cache.sqlite"))
+	pd.testing.assert_frame_equal(df, EXPECTED)
+	assert sorted(set(map(tuple, efetch.requests))) == [("SRR1", "SRR2"), ("SRR3", "SRR4"), ("SRR5",)]
+	assert len(efetch.requests) == 4
+
+def test_url_option(efetch, tmp_path, write_ids):
+	efetch.packages = PACKAGES
+	pango = tmp_path / "Pango_Random_Genomes_Stats.tsv"
+	pd.DataFrame({"GISAID_ID": ["EPI_ISL_{}".format(n) for n in range(1, 6)], "SRR_ID": list(PACKAGES)}).to_csv(pango, sep="\t", index=False)
+	env = dict(os.environ, NCBI_API_KEY="test")
+	subprocess.run([sys.executable, SCRIPT, "-f", write_ids(list(PACKAGES)), "-p", str(pango), "--url", efetch.url], cwd=str(tmp_path), env=env, check=True, stdout=subprocess.DEVNULL)
+	combined = pd.read_csv(tmp_path / "Random_Genomes_With_NCBI_Info.csv")
+	assert combined['SRR_ID'].tolist() == ["SRR1", "SRR2", "SRR4"] # the ARTIC V3 runs
+	assert combined['GISAID_ID'].tolist() == ["EPI_ISL_1", "EPI_ISL_2", "EPI_ISL_4"]
@@ -0,0 +1,59 @@
+## The primer scheme named by primer_rules.tsv for descriptions found in the SRA.
+
+import pytest
+import pandas as pd
+
+import NCBI_Scraping
+
+SANGER = "Illumina NovaSeq 6000 amplicon sequencing. Samples prepared and sequenced by The Lighthouse Lab in Milton Keynes and Alex Alderton, Roberto Amato, Sonia Goncalves, Ewan Harrison, David K. Jackson, Ian Johnston, Dominic Kwiatkowski, Cordelia Langford, John Sillitoe on behalf of the Wellcome Sanger Institute COVID-19 Surveillance Team (http://www.sanger.ac.uk/covid-team)"
+
+# Descriptions from the exact match dict clean_table used before the rules, they must still get the same name
+OLD_DICT = [
+	("Whole genome sequencing of SARS-CoV-2 using the Artic protocol V3 and Illumina MiSeq", "Artic protocol V3"),
+	("Whole genome sequencing of SARS-CoV-2 using the Artic protocol V3 and Oxford Nanopore GridION sequencing", "Artic protocol V3"),
+	(SANGER, "Unknown"),
+	("Illumina NovaSeq 6000 amplicon sequencing. Samples prepared and sequenced by Harper VanSteenhouse, Yumi Kasai, David Gray, Carol Clugston, Anna Dominiczak and Alex Alderton, Roberto Amato, Jeffrey Barrett, Sonia Goncalves, Ewan Harrison, David K. Jackson, Ian Johnston, Dominic Kwiatkowski, Cordelia Langford, John Sillitoe on behalf of the Wellcome Sanger Institute COVID-19 Surveillance Team (https:// www.sanger.ac.uk/covid-team)", "Unknown"),
+	("ARTIC Protocol V3 Illumina DNA Flex library prep", "Artic protocol V3"),
+	("ARTIC Protocol V3 - Illumina DNA Flex library prep", "Artic protocol V3"),
+	("ARTIC PCR - tiling of viral cDNA(V3), sequenced by Illumina MiSeq with DNA Flex library prep-kit.Only reads aligned to SARS-CoV-2 reference (NC_045512.2) retained.", "Artic protocol V3"),
+	("artic_primer_version 3", "Artic protocol V3"),
+	("SARS-CoV-2 Sequencing on Illumina MiSeq Using ARTIC Protocol", "Artic protocol V3"),
+	("ARTIC V3 PCR-tiling of viral cDNA", "Artic protocol V3"),
+	("Artic protocol V3", "Artic protocol V3"),
+	("ILLUMINA_DNA_PREP | Artic_V3", "Artic protocol V3"),
+	("ARTIC v3 amplicons, NexteraXT library, minimap2 v2.17, ivar v1.2, samtools v1.10. Using minimap2, short reads mapped to SARS-CoV-2 NCBI accession MN908947.3.", "Artic protocol V3"),
+	("ARTIC V3 amplicons, Nextera XT library, minimap2 v2.17, ivar v1.2.1, samtools v1.10.", "Artic protocol V3"),
+	("ARTIC v3, minimap2 v2.17, ivar v1.2.2, samtools v1.10.", "Artic protocol V3"),
+	("Artic_V3", "Artic protocol V3"),
+	("Total RNA from SARS-CoV-2 positive samples was converted to cDNA. Viral whole-genome amplification was performed according to the Artic Network protocol (https://artic.network/ncov-2019) using the SARS-CoV-2 primer scheme (V3).", "Artic protocol V3"),
+]
+
+# Descriptions that are not ARTIC V3 and must not end up in the V3 dataset
+OTHER_VERSIONS = [
+	("ARTIC V5.3.2", "Artic protocol V5"),
+	("ARTIC v2 primers", "Artic protocol V2"),
+	("ARTIC v1", "Artic protocol V1"),
+	("ARTIC Midnight 1200bp", "Midnight"),
+	("Midnight primers, ARTIC protocol", "Midnight"),
+	("ARTIC V3 amplicons, Illumina kit v4 chemistry", "Artic protocol V3"),
+	("Particle analysis v3", "Unknown"),
+	("ARTIC nCoV-2019 V4", "Artic protocol V4"),
+	("ARTIC V4.1", "Artic protocol V4.1"),
+	("artic_primer_version 4.1", "Artic protocol V4.1"),
+	("Nextera XT", "Nextera"),
+	("ARTIC amplicons", "Artic unknown version"),
+	("Sequenced with the ARTIC protocol", "Artic unknown version"),
+]
+
+@pytest.mark.parametrize("description, primers", OLD_DICT + OTHER_VERSIONS)
+def test_classify_primers(description, primers):
+	rules = NCBI_Scraping.load_primer_rules(NCBI_Scraping.PRIMER_RULES)
+	names, rule_names = NCBI_Scraping.classify_primers(pd.Series([description]), rules)
+	assert names[0] == primers, rule_names[0]
+
+def test_unversioned_artic_is_reported_not_kept(capsys):
+	table = pd.DataFrame({"SRR": ["SRR1", "SRR2", "SRR3"], "Primers": ["ARTIC v3", "ARTIC amplicons", "SARS-CoV-2 Sequencing on Illumina MiSeq Using ARTIC Protocol"],
+		"Protocol": ["", "", ""]})
+	cleaned = NCBI_Scraping.clean_table(table)
+	assert cleaned['SRR'].tolist() == ["SRR1", "SRR3"]
+	assert "ARTIC amplicons" in capsys.readouterr().out
@@ -0,0 +1,23 @@
+## The per stage measurements of run_manifest.py.
+
+import json
+import pytest
+
+import run_manifest
+
+def test_peak_rss_is_per_stage(tmp_path):
+	if not run_manifest.reset_peak_rss():
+		pytest.skip("the peak RSS can not be reset here")
+	manifest = run_manifest.RunManifest("test", {}, str(tmp_path / "manifest.json"))
+	with manifest.stage("big") as stage:
+		block = bytearray(200 * 1024 * 1024) # touched so it is resident
+		stage["records"] = len(block)
+		del block
+	with manifest.stage("small"):
+		small = bytearray(1024)
+	manifest.write()
+	with open(tmp_path / "manifest.json") as f:
+		big, small = json.load(f)["stages"]
+	assert big["peak_rss_bytes"] - small["peak_rss_bytes"] > 150 * 1024 * 1024
+	assert small["process_peak_rss_bytes"] >= big["peak_rss_bytes"]
+	assert big["records"] == 200 * 1024 * 1024
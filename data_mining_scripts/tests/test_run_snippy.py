@@ -0,0 +1,39 @@
+## run_snippy in Generate_fasta.py with the snippy stubs from benchmarks/stubs.
+
+import os
+import pytest
+
+import Generate_fasta
+
+STUBS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "stubs")
+
+def make_variant(variant, num_samples, done=False):
+	os.makedirs(variant)
+	with open(os.path.join(variant, variant + ".tab"), "w") as f:
+		for n in range(num_samples):
+			sample = "EPI_ISL_{}_{}".format(variant, n)
+			f.write("{}\t{}\n".format(sample, os.path.abspath(os.path.join(variant, sample + ".fasta"))))
+			if done == True:
+				os.makedirs(os.path.join(variant, sample))
+				open(os.path.join(variant, sample, "snps.tab"), "w").close()
+
+def test_failed_callback_cancels_queued_jobs(tmp_path, monkeypatch):
+	monkeypatch.chdir(tmp_path)
+	monkeypatch.setenv("PATH", STUBS + os.pathsep + os.environ.get("PATH", ""))
+	make_variant("B.1.1.7", 3, done=True)
+	make_variant("P.1", 50)
+	def on_variant_done(variant):
+		raise RuntimeError("stats failed for " + variant)
+	with pytest.raises(RuntimeError):
+		Generate_fasta.run_snippy(str(tmp_path), ["B.1.1.7", "P.1"], 1, 1, on_variant_done)
+	ran = [sample for sample in os.listdir("P.1") if os.path.isdir(os.path.join("P.1", sample))]
+	assert len(ran) < 50
+
+def test_all_jobs_run(tmp_path, monkeypatch):
+	monkeypatch.chdir(tmp_path)
+	monkeypatch.setenv("PATH", STUBS + os.pathsep + os.environ.get("PATH", ""))
+	make_variant("B.1.1.7", 3, done=True)
+	make_variant("P.1", 5)
+	finished = []
+	assert Generate_fasta.run_snippy(str(tmp_path), ["B.1.1.7", "P.1"], 4, 1, finished.append) == 5
+	assert sorted(finished) == ["B.1.1.7", "P.1"]
@@ -0,0 +1,59 @@
+## The seeded reservoir sampling of sample_fasta in Generate_fasta.py.
+
+import os
+import pytest
+
+import Generate_fasta
+
+LINEAGES = {"B.1.1.7": 50, "P.1": 5, "B.1.351": 10}
+
+@pytest.fixture
+def fasta(tmp_path, monkeypatch):
+	'''A fasta with the lineages mixed together and the lookup of each header to its lineage.'''
+	monkeypatch.chdir(tmp_path)
+	taxon_lineage = {}
+	with open("all.fasta", "w") as f:
+		for n in range(max(LINEAGES.values())):
+			for lineage, count in LINEAGES.items():
+				if n < count:
+					header = "hCoV-19/USA/{}-{}/2021|EPI_ISL_{}_{}|2021-01-01".format(lineage, n, lineage, n)
+					taxon_lineage[header] = lineage
+					f.write(">" + header + "\nACGT\nACGT\n")
+	return "all.fasta", taxon_lineage
+
+def picked(lineage, seq_num):
+	return [header for header, seq in Generate_fasta.read_fasta(Generate_fasta.random_fasta_name(lineage, seq_num))]
+
+def test_same_seed_picks_the_same_genomes(fasta):
+	full_fasta, taxon_lineage = fasta
+	runs = []
+	for seed in [7, 7, 8]:
+		Generate_fasta.sample_fasta(full_fasta, taxon_lineage, list(LINEAGES), 10, seed, [])
+		runs.append(picked("B.1.1.7", 10))
+	assert runs[0] == runs[1]
+	assert runs[0] != runs[2]
+
+def test_reservoir_sizes(fasta):
+	full_fasta, taxon_lineage = fasta
+	seq_counts, matched = Generate_fasta.sample_fasta(full_fasta, taxon_lineage, list(LINEAGES), 10, 1, [])
+	assert seq_counts == {"B.1.1.7": 10, "P.1": 5, "B.1.351": 10} # fewer than 10 keeps them all, exactly 10 keeps them all
+	assert matched == set(taxon_lineage)
+	for lineage in LINEAGES:
+		headers = picked(lineage, 10)
+		assert len(set(headers)) == len(headers)
+		assert all(taxon_lineage[header] == lineage for header in headers)
+	assert sorted(picked("B.1.351", 10)) == sorted(header for header, lineage in taxon_lineage.items() if lineage == "B.1.351")
+
+def test_every_genome_can_be_picked(fasta):
+	full_fasta, taxon_lineage = fasta
+	seen = set()
+	for seed in range(40):
+		Generate_fasta.sample_fasta(full_fasta, taxon_lineage, ["B.1.1.7"], 10, seed, [])
+		seen.update(picked("B.1.1.7", 10))
+	assert len(seen) == LINEAGES["B.1.1.7"]
+
+def test_lineage_not_in_fasta(fasta):
+	full_fasta, taxon_lineage = fasta
+	seq_counts, matched = Generate_fasta.sample_fasta(full_fasta, taxon_lineage, ["B.1.1.7", "B.1.617.2"], 10, 1, [])
+	assert seq_counts["B.1.617.2"] == 0
+	assert os.path.getsize(Generate_fasta.random_fasta_name("B.1.617.2", 10)) == 0
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+
+# Downloads a dataset spreadsheet, like GenFSGopher.pl, without make.
+# Files are downloaded by a pool of workers and their sha256 is calculated
+# on the chunks as they stream in so no file has to be read a second time.
+#
+# WGS standards and analysis group of the Gen-FS collaboration
+
+import os, sys, time, hashlib, shutil, subprocess, http.client, urllib.request, urllib.error
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+VERSION = "0.1.0"
+
+NUCLEOTIDE_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi?db=nuccore&id={accession}&rettype=fasta&retmode=text"
+CHUNK_SIZE = 1024 * 1024
+TIMEOUT = 300 # seconds a connection can stall before the download is tried again
+RETRIES = 3 # like the edirect loop in GenFSGopher.pl
+RETRY_BACKOFF = 5 # seconds to wait after the first failed try, doubled after each one
+
+def logmsg(*args):
+	print(os.path.basename(sys.argv[0]) + ":", *args, file=sys.stderr)
+
+def parse_cmdline():
+	"""Parse command-line arguments for script."""
+	parser = ArgumentParser(prog="fetchDataset.py", description="""Reads a standard dataset spreadsheet and downloads its data.
+	Files that were already downloaded and match their sha256 are skipped, so the script can be run again after a failure.""")
+	parser.add_argument("spreadsheet", help="The dataset spreadsheet in tsv format, see SPECIFICATION.md.")
+	parser.add_argument("-o", "--outdir", dest="outdir", required=True, help="The output directory.")
+	parser.add_argument("-n", "--numcpus", dest="numcpus", type=int, default=1, help="How many downloads to run at once. Be careful of disk I/O.")
+	parser.add_argument("-l", "--layout", dest="layout", default="onedir", choices=["onedir", "byrun"], help="onedir puts everything into one directory, byrun gives each genome its own directory.")
+	parser.add_argument("--reads-url", dest="reads_url", default=None, help="Download reads from this url instead of running fastq-dump. {accession} and {read} (1 or 2) are filled in, e.g. file:///data/sra/{accession}_{read}.fastq")
+	parser.add_argument("--nucleotide-url", dest="nucleotide_url", default=NUCLEOTIDE_URL, help="The url nucleotide fastas are downloaded from, {accession} is filled in.")
+	parser.add_argument("--timeout", dest="timeout", type=float, default=TIMEOUT, help="Seconds a download can stall before it is tried again, up to %d tries." % RETRIES)
+	parser.add_argument("--version", action="version", version="%(prog)s " + VERSION)
+	return parser.parse_args()
+
+def is_missing(value):
+	"""Dashes and NA mean there is no value in the spreadsheet."""
+	return value is None or value == "" or value == "-" or value.upper() == "NA"
+
+def parse_spreadsheet(spreadsheet):
+	"""Reads the key/value header and the sample table of a dataset spreadsheet.
+	Returns the header as a dictionary and the samples as a list of dictionaries, with lowercase keys and column names."""
+	header = {}
+	samples = []
+	columns = None
+	with open(spreadsheet) as f:
+		for line in f:
+			line = line.strip()
+			if line == "":
+				continue
+			if columns is not None:
+				values = [value.strip().strip("'\"").strip() for value in line.split("\t")]
+				samples.append(dict(zip(columns, values)))
+			elif "biosample_acc" in line.lower() and "strain" in line.lower():
+				columns = line.lower().split("\t")
+			else:
+				fields = line.split("\t")
+				header[fields[0].lower()] = fields[1].strip() if len(fields) > 1 else ""
+	return header, samples
+
+def plan_downloads(header, samples, outdir, layout, reads_url, nucleotide_url, api_key=None):
+	"""Lists every file to download as a dictionary with the path, where it comes from and its expected sha256 (None when not in the spreadsheet).
+	The NCBI api_key is added to the nucleotide urls when given."""
+	downloads = []
+	if not is_missing(header.get("tree")):
+		downloads.append({"paths": [os.path.join(outdir, "tree.dnd")], "source": ("url", header["tree"]), "sha256": [None]})
+	for sample in samples:
+		dumpdir = outdir if layout == "onedir" else os.path.join(outdir, sample.get("strain", ""))
+		for column in ["srarun_acc", "nucleotide", "genbankassembly"]:
+			if not is_missing(sample.get(column)) and is_missing(sample.get("strain")):
+				raise ValueError("{} does not have a strain name!".format(sample[column]))
+		if not is_missing(sample.get("srarun_acc")):
+			accession = sample["srarun_acc"]
+			paths = [os.path.join(dumpdir, sample["strain"] + "_1.fastq"), os.path.join(dumpdir, sample["strain"] + "_2.fastq")]
+			sha256 = [None if is_missing(sample.get(column)) else sample[column].lower() for column in ["sha256sumread1", "sha256sumread2"]]
+			if reads_url is None:
+				downloads.append({"paths": paths, "source": ("fastq-dump", accession), "sha256": sha256})
+			else: # each read is its own file at the url
+				for read, path, expected in zip([1, 2], paths, sha256):
+					downloads.append({"paths": [path], "source": ("url", reads_url.format(accession=accession, read=read)), "sha256": [expected], "optional": read == 2})
+		if not is_missing(sample.get("nucleotide")):
+			expected = None if is_missing(sample.get("sha256sumnucleotide")) else sample["sha256sumnucleotide"].lower()
+			url = nucleotide_url.format(accession=sample["nucleotide"])
+			if api_key:
+				url = url + "&api_key=" + api_key
+			downloads.append({"paths": [os.path.join(dumpdir, sample["strain"] + ".fna")], "source": ("url", url), "sha256": [expected]})
+		if not is_missing(sample.get("genbankassembly")):
+			logmsg("WARNING: skipping assembly {} for {}, use GenFSGopher.pl for GenBank assemblies".format(sample["genbankassembly"], sample["strain"]))
+	return downloads
+
+def is_done(path, expected):
+	"""A file is done if its .sha256 was written after it downloaded and it matches the spreadsheet."""
+	if not os.path.exists(path) or not os.path.exists(path + ".sha256"):
+		return False
+	with open(path + ".sha256") as f:
+		recorded = f.read().split()
+	return len(recorded) > 0 and (expected is None or recorded[0] == expected)
+
+def all_done(item):
+	"""True when every file of a download is done."""
+	return all([is_done(path, expected) for path, expected in zip(item["paths"], item["sha256"])])
+
+def is_retryable(error):
+	"""Too many requests, server errors, stalled or dropped connections are worth trying again, a missing file or a bad request is not."""
+	if isinstance(error, urllib.error.HTTPError):
+		return error.code == 429 or error.code >= 500
+	if isinstance(error, urllib.error.URLError) and isinstance(error.reason, FileNotFoundError): # file:// urls
+		return False
+	return isinstance(error, (urllib.error.URLError, http.client.HTTPException, ConnectionError, TimeoutError)) and not isinstance(error, FileNotFoundError)
+
+def redact(url):
+	"""The url without the NCBI api key, for log messages."""
+	return url.split("&api_key=")[0]
+
+def stream_url(url, paths, optional=False, timeout=TIMEOUT, retries=RETRIES):
+	"""Streams a url (http(s), ftp or file) into paths[0], hashing the chunks as they are written.
+	Failures that may pass, like HTTP 429 from NCBI, are tried again up to retries times with a growing wait in between."""
+	for attempt in range(retries):
+		sha = hashlib.sha256()
+		try:
+			with open(paths[0] + ".tmp", "wb") as out:
+				try:
+					response = urllib.request.urlopen(url, timeout=timeout)
+				except (FileNotFoundError, urllib.error.URLError) as e:
+					if not optional or is_retryable(e):
+						raise
+					response = None # e.g. there is no second read for a single end run, which gives an empty file like GenFSGopher.pl
+				if response is not None:
+					with response:
+						for chunk in iter(lambda: response.read(CHUNK_SIZE), b""):
+							out.write(chunk)
+							sha.update(chunk)
+			return [sha.hexdigest()]
+		except Exception as e:
+			if not is_retryable(e) or attempt == retries - 1:
+				raise
+			wait = RETRY_BACKOFF * 2 ** attempt
+			logmsg("WARNING: try {} of {} for {} failed ({}), trying again in {} seconds".format(attempt + 1, retries, redact(url), e, wait))
+			time.sleep(wait)
+
+def stream_fastq_dump(accession, paths):
+	"""Streams fastq-dump into the _1 and _2 files, hashing as it goes. A read only goes into _1 or _2 when the /1 and /2 of its spot come one after the other,
+	the reads --split-3 would put into <accession>.fastq are kept aside and dropped if the run is paired, like GenFSGopher.pl.
+	Single end runs have only those reads, they become the _1 file and _2 is empty."""
+	cmd = ["fastq-dump", "--defline-seq", "@$ac_$sn/$ri", "--defline-qual", "+", "--split-3", "-Z", accession]
+	single_path = paths[0] + ".single.tmp"
+	shas = [hashlib.sha256(), hashlib.sha256(), hashlib.sha256()]
+	outs = [open(path + ".tmp", "wb") for path in paths] + [open(single_path, "wb")]
+	pairs = 0
+	def write(read, chunk):
+		outs[read].write(chunk)
+		shas[read].update(chunk)
+	try:
+		with subprocess.Popen(cmd, stdout=subprocess.PIPE) as proc:
+			pending = None # a /1 read waiting for the /2 of its spot
+			while True:
+				record = [proc.stdout.readline() for _ in range(4)]
+				if record[0] == b"":
+					break
+				spot, _, read = record[0].rstrip().rpartition(b"/")
+				if read == b"2" and pending is not None and pending[0] == spot:
+					write(0, pending[1])
+					write(1, b"".join(record))
+					pairs = pairs + 1
+					pending = None
+					continue
+				if pending is not None:
+					write(2, pending[1])
+					pending = None
+				if read == b"1":
+					pending = (spot, b"".join(record))
+				else:
+					write(2, b"".join(record))
+			if pending is not None:
+				write(2, pending[1])
+		if proc.returncode != 0:
+			raise RuntimeError("fastq-dump failed on {} with exit code {}".format(accession, proc.returncode))
+	except BaseException:
+		for out in outs:
+			out.close()
+		os.remove(single_path)
+		raise
+	for out in outs:
+		out.close()
+	if pairs == 0:
+		os.replace(single_path, paths[0] + ".tmp")
+		return [shas[2].hexdigest(), shas[1].hexdigest()]
+	os.remove(single_path)
+	return [sha.hexdigest() for sha in shas[:2]]
+
+def download(item, timeout=TIMEOUT):
+	"""Downloads one item and checks the sha256 of each of its files. Returns a list of (path, sha256, status) where status is OK, FAILED or NEW (no sha256 in the spreadsheet)."""
+	for path in item["paths"]:
+		os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+	kind, source = item["source"]
+	try:
+		if kind == "fastq-dump":
+			sha256 = stream_fastq_dump(source, item["paths"])
+		else:
+			sha256 = stream_url(source, item["paths"], item.get("optional", False), timeout)
+	except Exception:
+		for path in item["paths"]: # do not leave partial downloads behind
+			if os.path.exists(path + ".tmp"):
+				os.remove(path + ".tmp")
+		raise
+	results = []
+	for path, actual, expected in zip(item["paths"], sha256, item["sha256"]):
+		os.replace(path + ".tmp", path) # only complete downloads get the real name
+		status = "NEW" if expected is None else ("OK" if actual == expected else "FAILED")
+		if status != "FAILED":
+			with open(path + ".sha256", "w") as f:
+				f.write("{}  {}\n".format(actual, os.path.basename(path)))
+		results.append((path, actual, status))
+	return results
+
+def fetch_dataset(spreadsheet, outdir, numcpus=1, layout="onedir", reads_url=None, nucleotide_url=NUCLEOTIDE_URL, api_key=None, timeout=TIMEOUT):
+	"""Downloads everything in the spreadsheet into outdir with numcpus workers and writes sha256sum.log. Returns the number of files that failed."""
+	os.makedirs(outdir, exist_ok=True)
+	shutil.copyfile(spreadsheet, os.path.join(outdir, "in.tsv"))
+	header, samples = parse_spreadsheet(spreadsheet)
+	downloads = plan_downloads(header, samples, outdir, layout, reads_url, nucleotide_url, api_key)
+	if is_missing(header.get("tree")): # an empty placeholder like GenFSGopher.pl
+		logmsg("No tree was supplied")
+		open(os.path.join(outdir, "tree.dnd"), "w").close()
+	todo = []
+	results = {}
+	for item in downloads:
+		if all_done(item):
+			for path, expected in zip(item["paths"], item["sha256"]):
+				results[path] = "OK" if expected is not None else "NEW"
+		else:
+			todo.append(item)
+	logmsg("{} of {} downloads were already done, downloading {} with {} workers".format(len(downloads) - len(todo), len(downloads), len(todo), numcpus))
+	failed = 0
+	with ThreadPoolExecutor(max_workers=numcpus) as pool:
+		futures = {pool.submit(download, item, timeout): item for item in todo}
+		for future in as_completed(futures):
+			try:
+				for path, actual, status in future.result():
+					results[path] = status
+					if status == "FAILED":
+						logmsg("ERROR: sha256 of {} is {} but the spreadsheet has {}".format(path, actual, futures[future]["sha256"][futures[future]["paths"].index(path)]))
+			except Exception as e:
+				for path in futures[future]["paths"]:
+					results[path] = "FAILED"
+				logmsg("ERROR: could not download {}: {}".format(redact(futures[future]["source"][1]), e))
+	with open(os.path.join(outdir, "sha256sum.log"), "w") as f:
+		for path in sorted(results):
+			if results[path] == "FAILED":
+				failed = failed + 1
+			f.write("{}: {}\n".format(os.path.relpath(path, outdir), results[path]))
+	return failed
+
+def main():
+	args = parse_cmdline()
+	if not os.environ.get("NCBI_API_KEY"):
+		logmsg("WARNING: no NCBI key was detected in variable NCBI_API_KEY! Please add it to your environment. See README.md for more details")
+	failed = fetch_dataset(args.spreadsheet, args.outdir, args.numcpus, args.layout, args.reads_url, args.nucleotide_url, os.environ.get("NCBI_API_KEY"), args.timeout)
+	if failed > 0:
+		logmsg("ERROR: {} files failed, see {}. Run the same command again to retry them.".format(failed, os.path.join(args.outdir, "sha256sum.log")))
+		return 1
+	logmsg("DONE! If you used this script in a publication, please cite us at github.com/WGS-standards-and-analysis/datasets")
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,86 @@
+#!/usr/bin/env bats
+
+# https://github.com/bats-core/bats-core
+
+load "inc/environment"
+
+function note(){
+  echo "# $1" >&3
+}
+
+# Make a small dataset whose reads come from local files instead of the SRA
+function setup(){
+  TMP=$(mktemp -d)
+  mkdir -p $TMP/sra
+  printf "@SRR1.1/1\nACGT\n+\nIIII\n" > $TMP/sra/SRR1_1.fastq
+  printf "@SRR1.1/2\nTTGC\n+\nIIII\n" > $TMP/sra/SRR1_2.fastq
+  printf "@SRR2.1/1\nGGAA\n+\nIIII\n" > $TMP/sra/SRR2_1.fastq
+  hash1=$(sha256sum < $TMP/sra/SRR1_1.fastq | cut -c 1-64)
+  hash2=$(sha256sum < $TMP/sra/SRR1_2.fastq | cut -c 1-64)
+  hash3=$(sha256sum < $TMP/sra/SRR2_1.fastq | cut -c 1-64)
+  empty=$(sha256sum < /dev/null | cut -c 1-64)
+  printf "Organism\tSARS-CoV-2\ntree\t-\n\n" > $TMP/in.tsv
+  printf "biosample_acc\tstrain\tSRArun_acc\tgenBankAssembly\tnucleotide\tsha256sumRead1\tsha256sumRead2\n" >> $TMP/in.tsv
+  printf "SAMN1\tpaired\tSRR1\t-\t-\t$hash1\t$hash2\n" >> $TMP/in.tsv
+  printf "SAMN2\tsingle\tSRR2\t-\t-\t$hash3\t$empty\n" >> $TMP/in.tsv
+  URL="file://$TMP/sra/{accession}_{read}.fastq"
+}
+
+function teardown(){
+  rm -rf $TMP
+}
+
+@test "fetchDataset.py downloads and verifies" {
+  run fetchDataset.py --numcpus 2 --reads-url "$URL" -o $TMP/out $TMP/in.tsv
+  note "$output"
+  [ "$status" -eq 0 ]
+  run grep -c ": OK" $TMP/out/sha256sum.log
+  [ "$output" -eq 4 ]
+  cmp $TMP/sra/SRR1_2.fastq $TMP/out/paired_2.fastq
+  [ ! -s $TMP/out/single_2.fastq ]
+  # no tree in the spreadsheet gives an empty tree.dnd like GenFSGopher.pl
+  [ -e $TMP/out/tree.dnd ]
+  [ ! -s $TMP/out/tree.dnd ]
+}
+
+@test "fetchDataset.py skips verified files and catches bad hashsums" {
+  run fetchDataset.py --reads-url "$URL" -o $TMP/out $TMP/in.tsv
+  [ "$status" -eq 0 ]
+  run fetchDataset.py --reads-url "$URL" -o $TMP/out $TMP/in.tsv
+  [[ "$output" =~ "4 of 4 downloads were already done" ]]
+
+  echo "changed" >> $TMP/sra/SRR2_1.fastq
+  rm $TMP/out/single_1.fastq.sha256
+  run fetchDataset.py --reads-url "$URL" -o $TMP/out $TMP/in.tsv
+  note "$output"
+  [ "$status" -eq 1 ]
+  grep "single_1.fastq: FAILED" $TMP/out/sha256sum.log
+}
+
+@test "fetchDataset.py drops the orphan reads fastq-dump gives for a paired run" {
+  # a stub fastq-dump that prints what fastq-dump --split-3 -Z gives: spot 2 of SRR3 lost its /2 read
+  mkdir -p $TMP/bin
+  printf '#!/bin/sh\nfor acc; do :; done\ncat %s/sra/$acc.dump\n' "$TMP" > $TMP/bin/fastq-dump
+  chmod +x $TMP/bin/fastq-dump
+  printf "@SRR3_1/1\nACGT\n+\nIIII\n@SRR3_1/2\nTTGC\n+\nIIII\n@SRR3_2/1\nCCCC\n+\nIIII\n@SRR3_3/1\nGGGG\n+\nIIII\n@SRR3_3/2\nAAAA\n+\nIIII\n" > $TMP/sra/SRR3.dump
+  printf "@SRR4_1/1\nACGT\n+\nIIII\n@SRR4_2/1\nTTGC\n+\nIIII\n" > $TMP/sra/SRR4.dump
+  printf "@SRR3_1/1\nACGT\n+\nIIII\n@SRR3_3/1\nGGGG\n+\nIIII\n" > $TMP/sra/SRR3_1.fastq
+  printf "@SRR3_1/2\nTTGC\n+\nIIII\n@SRR3_3/2\nAAAA\n+\nIIII\n" > $TMP/sra/SRR3_2.fastq
+  hash1=$(sha256sum < $TMP/sra/SRR3_1.fastq | cut -c 1-64)
+  hash2=$(sha256sum < $TMP/sra/SRR3_2.fastq | cut -c 1-64)
+  hash3=$(sha256sum < $TMP/sra/SRR4.dump | cut -c 1-64)
+  printf "Organism\tSARS-CoV-2\ntree\t-\n\n" > $TMP/dump.tsv
+  printf "biosample_acc\tstrain\tSRArun_acc\tgenBankAssembly\tnucleotide\tsha256sumRead1\tsha256sumRead2\n" >> $TMP/dump.tsv
+  printf "SAMN3\tpaired\tSRR3\t-\t-\t$hash1\t$hash2\n" >> $TMP/dump.tsv
+  printf "SAMN4\tsingle\tSRR4\t-\t-\t$hash3\t$empty\n" >> $TMP/dump.tsv
+
+  PATH="$TMP/bin:$PATH" run fetchDataset.py --numcpus 2 -o $TMP/out $TMP/dump.tsv
+  note "$output"
+  [ "$status" -eq 0 ]
+  run grep -c ": OK" $TMP/out/sha256sum.log
+  [ "$output" -eq 4 ]
+  cmp $TMP/sra/SRR3_1.fastq $TMP/out/paired_1.fastq
+  cmp $TMP/sra/SRR4.dump $TMP/out/single_1.fastq
+  [ ! -s $TMP/out/single_2.fastq ]
+  [ ! -e $TMP/out/paired_1.fastq.single.tmp ]
+}